@@ -6,6 +6,12 @@ from itertools import combinations_with_replacement as comb
 # from scipy.sparse.linalg import eigsh
 # from scipy.sparse.linalg import eigs
 import os
+try:
+    from .unitary import unitary_update, exp_general
+    from .pythTB_wan import Hop_table
+except ImportError:  # imported as a top-level module with WanPy on the path
+    from unitary import unitary_update, exp_general
+    from pythTB_wan import Hop_table
 cwd = os.getcwd() 
 
 
@@ -106,27 +112,47 @@ def gen_k_mesh(*nks, centered=False, flat=True, endpoint=False):
 
 
 def get_boundary_phase(*nks, orbs, idx_shell):
-    k_idx_arr = list(
-        product(*[range(nk) for nk in nks])
-    )  # all pairwise combinations of k_indices
-
-    bc_phase = np.ones((*nks, idx_shell[0].shape[0], orbs.shape[0]), dtype=complex)
-
-    for k_idx_idx, k_idx in enumerate(k_idx_arr):
-        for shell_idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-            k_nbr_idx = np.array(k_idx) + idx_vec
-            # apply pbc to index
-            mod_idx = np.mod(k_nbr_idx, nks)
-            diff = k_nbr_idx - mod_idx
-            G = np.divide(np.array(diff), np.array(nks))
-            # if the translated k-index contains the -1st or last_idx+1 then we crossed the BZ boundary
-            cross_bndry = np.any((k_nbr_idx == -1) | np.logical_or.reduce([k_nbr_idx == nk for nk in nks]))
-            if cross_bndry:
-                bc_phase[k_idx][shell_idx]= np.exp(-1j * 2 * np.pi * orbs @ G.T).T
+    """
+    Phases exp(-i G . r) picked up by the cell periodic states at neighbors k+b across the
+    BZ boundary. Since the phase factorizes over the components of G, it is stored per
+    neighbor as one orbital phase vector for each direction b wraps around, along with the
+    slab of k-indices along that direction it is applied to.
+
+    Returns:
+        bc_phase (list): [shell_idx][i] -> (axis, slab, phase[orb])
+    """
+    bc_phase = []
+    for idx_vec in idx_shell[0]:  # nearest neighbors
+        slabs = []
+        for axis, shift in enumerate(idx_vec):
+            if shift == 0:
+                continue
+            nk = nks[axis]
+            # the last (first) |shift| k-indices are translated across the boundary by G = +1 (-1)
+            slab = slice(nk - shift, nk) if shift > 0 else slice(0, -shift)
+            phase = np.exp(-1j * 2 * np.pi * orbs[:, axis] * np.sign(shift))
+            slabs.append((axis, slab, phase))
+        bc_phase.append(slabs)
 
     return bc_phase
 
 
+def get_nbr_states(u_wfs, idx_vec, bc_phase_b):
+    """
+    States at the neighboring k-points u_{n, k+b} including the phase across the BZ boundary.
+
+    Args:
+        u_wfs (np.array): cell periodic states [*nks, idx, orb]
+        idx_vec (np.array): integer vector connecting k to k+b
+        bc_phase_b (list): boundary slabs of this neighbor from `get_boundary_phase`
+    """
+    dim_k = len(idx_vec)
+    states_pbc = np.roll(u_wfs, shift=tuple(-idx_vec), axis=tuple(range(dim_k)))
+    for axis, slab, phase in bc_phase_b:
+        states_pbc[(slice(None),) * axis + (slab,)] *= phase
+    return states_pbc
+
+
 def get_orb_phases(orbs, k_vec, inverse=False):
     """
     Introduces e^i{k.tau} factors
@@ -478,11 +504,12 @@ def k_overlap_mat(lat_vecs, orbs, u_wfs):
     bc_phase = get_boundary_phase(*nks, orbs=orbs, idx_shell=idx_shell)
 
     # assumes that there is no last element in the k mesh, so we need to introduce phases
+    # overlaps keep the precision of the states (complex64 or complex128)
     M = np.zeros(
-        (*nks, len(idx_shell[0]), n_states, n_states), dtype=complex
+        (*nks, len(idx_shell[0]), n_states, n_states), dtype=np.result_type(u_wfs, np.complex64)
     )  # overlap matrix
     for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-        states_pbc = np.roll(u_wfs, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
+        states_pbc = get_nbr_states(u_wfs, idx_vec, bc_phase[idx])
         M[..., idx, :, :] = np.einsum("...mj, ...nj -> ...mn", u_wfs.conj(), states_pbc)
     return M
 
@@ -602,7 +629,35 @@ def swap_reps(eigvecs, k_points, swap_pts, swap_scheme):
 ####### Wannier interpolation ########
 
 
-def diag_h_in_subspace(model, eigvecs, k_path, ret_evecs=False):
+def get_hop_table(model):
+    """
+    Compiles the hoppings of a pythtb model so that the Bloch Hamiltonian can be
+    assembled for many k-points at once with `gen_ham`.
+
+    Args:
+        model (pythtb.model): spinless tight-binding model
+
+    Returns:
+        hop_table (Hop_table): compiled hoppings, see `pythTB_wan.Hop_table`
+    """
+    return Hop_table(model)
+
+
+def gen_ham(hop_table, k_pts):
+    """
+    Bloch Hamiltonian for a batch of k-points from a compiled hopping table.
+
+    Args:
+        hop_table (Hop_table): output of `get_hop_table`
+        k_pts (np.array): k-points in reduced coordinates [..., dim_k]
+
+    Returns:
+        H_k (np.array): Bloch Hamiltonian [..., orb, orb]
+    """
+    return hop_table.gen_ham(k_pts)
+
+
+def diag_h_in_subspace(model, eigvecs, k_path, ret_evecs=False, hop_table=None):
     """
     Diagonalize the Hamiltonian in a projected subspace
 
@@ -613,37 +668,27 @@ def diag_h_in_subspace(model, eigvecs, k_path, ret_evecs=False):
             Eigenvectors spanning the target subspace
         k_path (np.array):
             1D path on which we want to diagonalize the Hamiltonian
+        hop_table (Hop_table, optional):
+            Compiled hoppings of the model from `get_hop_table`. Compiled from
+            the model if not given.
 
     Returns:
         eigvals (np.array):
             eigenvalues in subspace
     """
     if isinstance(eigvecs, wf_array):
-        shape = eigvecs._wfs.shape  # [*nks, idx, orb]
-    else:
-        shape = eigvecs.shape  # [*nks, idx, orb]
+        eigvecs = np.array(eigvecs._wfs)  # [*nks, idx, orb]
 
-    nks = shape[:-2]
-    n_orb = shape[-1]
-    n_states = shape[-2]
+    if hop_table is None:
+        hop_table = get_hop_table(model)
 
-    H_k_proj = np.zeros([*nks, n_states, n_states], dtype=complex)
+    H_k = gen_ham(hop_table, k_path)
+    # projected Hamiltonian V^dag H V with V = [orb, num_evecs]
+    H_k_proj = eigvecs.conj() @ H_k @ np.swapaxes(eigvecs, -1, -2)
 
-    for k_idx, k in enumerate(k_path):
-        H_k = model._gen_ham(k)
-        V = np.transpose(eigvecs[k_idx], axes=(1, 0))  # [orb, num_evecs]
-        H_k_proj[k_idx, :, :] = V.conj().T @ H_k @ V  # projected Hamiltonian
-
-    eigvals = np.zeros((*nks, n_states), dtype=complex)
-    evecs = np.zeros((*nks, n_states, n_orb), dtype=complex)
-
-    for idx, k in enumerate(k_path):
-        eigvals[idx, :], evec = np.linalg.eigh(H_k_proj[idx])  # [k, n], [evec wt, n]
-        for i in range(evec.shape[1]):
-            # Returns in given eigvec basis
-            evecs[idx, i, :] = sum(
-                [evec[j, i] * eigvecs[idx, j, :] for j in range(evec.shape[0])]
-            )
+    eigvals, evec = np.linalg.eigh(H_k_proj)  # [k, n], [k, evec wt, n]
+    # Returns in given eigvec basis
+    evecs = np.swapaxes(evec, -1, -2) @ eigvecs
 
     if ret_evecs:
         return eigvals.real, evecs
@@ -674,14 +719,15 @@ def find_optimal_subspace(
     bc_phase = get_boundary_phase(*nks, orbs=orbs, idx_shell=idx_shell)
 
     P = np.einsum("...ni, ...nj->...ij", inner_states, inner_states.conj())
+    dtype = P.dtype  # precision of the states
 
     # Projector on initial subspace at each k (for pbc of neighboring spaces)
-    P_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-    Q_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-    T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
+    P_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=dtype)
+    Q_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=dtype)
+    T_kb = np.zeros((*nks, num_nnbrs), dtype=dtype)
 
     for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-        states_pbc = np.roll(inner_states, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
+        states_pbc = get_nbr_states(inner_states, idx_vec, bc_phase[idx])
         P_nbr[..., idx, :, :] = np.einsum(
                 "...ni, ...nj->...ij", states_pbc, states_pbc.conj()
                 )
@@ -693,7 +739,7 @@ def find_optimal_subspace(
     Q_nbr_min = np.copy(Q_nbr)  # start of iteration
 
     # states spanning optimal subspace minimizing gauge invariant spread
-    states_min = np.zeros((*nks, dim_subspace, n_orb), dtype=complex)
+    states_min = np.zeros((*nks, dim_subspace, n_orb), dtype=dtype)
     omega_I_prev = (1 / Nk) * w_b[0] * np.sum(T_kb)
 
     for i in range(iter_num):
@@ -707,7 +753,7 @@ def find_optimal_subspace(
         P_min = alpha * P_new + (1 - alpha) * P_min # for next iteration
         
         for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-            states_pbc = np.roll(states_min, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
+            states_pbc = get_nbr_states(states_min, idx_vec, bc_phase[idx])
             P_nbr_min[..., idx, :, :] = np.einsum(
                     "...ni, ...nj->...ij", states_pbc, states_pbc.conj()
                     )
@@ -732,16 +778,8 @@ def find_optimal_subspace(
 
 
 def mat_exp(M):
-    eigvals, eigvecs = np.linalg.eig(M)
-    U = eigvecs
-    U_inv = np.linalg.inv(U)
-
-    # Diagonal matrix of the exponentials of the eigenvalues
-    exp_diagM = np.exp(eigvals)
-
-    # Construct the matrix exponential
-    expM = np.einsum('...ij,...jk->...ik', U, np.multiply(U_inv, exp_diagM[..., :, np.newaxis]))
-    return expM
+    """General matrix exponential. Gauge updates use `unitary.unitary_update` instead."""
+    return exp_general(M)
 
 class AdamOptimizer:
     def __init__(self, shape, lr=1e-3, beta1=0.9, beta2=0.999, eps=1e-8):
@@ -762,7 +800,9 @@ class AdamOptimizer:
         update = self.lr * m_hat / (np.sqrt(v_hat) + self.eps)
         return update
 
-def find_min_unitary(u_wfs, lat_vecs, orbs, eps=1 / 160, iter_num=10, verbose=False, tol=1e-12):
+def find_min_unitary(
+        u_wfs, lat_vecs, orbs, eps=1 / 160, iter_num=10, verbose=False, tol=1e-12, update="eigh"
+        ):
     """
     Finds the unitary that minimizing the gauge dependent part of the spread. 
 
@@ -774,6 +814,7 @@ def find_min_unitary(u_wfs, lat_vecs, orbs, eps=1 / 160, iter_num=10, verbose=Fa
         verbose: Whether to print the spread at each iteration
         tol: If difference of spread is lower that tol for consecutive iterations,
             the loop breaks
+        update: Unitary step exp(eps * G), "eigh", "cayley" or "eig". See `unitary.unitary_update`.
 
     Returns:
         U: The unitary matrix
@@ -791,8 +832,11 @@ def find_min_unitary(u_wfs, lat_vecs, orbs, eps=1 / 160, iter_num=10, verbose=Fa
     w_b, k_shell, idx_shell = get_weights(*nks, lat_vecs=lat_vecs, N_sh=1)
     w_b, k_shell = w_b[0], k_shell[0]
 
-    U = np.zeros((*nks, num_state, num_state), dtype=complex)  # unitary transformation
-    U[...] = np.eye(num_state, dtype=complex)  # initialize as identity
+    dtype = M.dtype  # precision of the states
+    real_dtype = np.finfo(dtype).dtype
+
+    U = np.zeros((*nks, num_state, num_state), dtype=dtype)  # unitary transformation
+    U[...] = np.eye(num_state, dtype=dtype)  # initialize as identity
     M0 = np.copy(M)  # initial overlap matrix
     M = np.copy(M)  # new overlap matrix
 
@@ -804,14 +848,14 @@ def find_min_unitary(u_wfs, lat_vecs, orbs, eps=1 / 160, iter_num=10, verbose=Fa
         log_diag_M_imag = np.log(np.diagonal(M, axis1=-1, axis2=-2)).imag
         r_n = -(1 / Nk) * w_b * np.sum(
             log_diag_M_imag, axis=(0,1)).T @ k_shell
-        q = log_diag_M_imag + (k_shell @ r_n.T)
+        q = (log_diag_M_imag + (k_shell @ r_n.T)).astype(real_dtype, copy=False)
         R = np.multiply(M, np.diagonal(M, axis1=-1, axis2=-2)[..., np.newaxis, :].conj())
         T = np.multiply(np.divide(M, np.diagonal(M, axis1=-1, axis2=-2)[..., np.newaxis, :]), q[..., np.newaxis, :])
         A_R = (R - np.transpose(R, axes=(0,1,2,4,3)).conj()) / 2
         S_T = (T + np.transpose(T, axes=(0,1,2,4,3)).conj()) / (2j)
         G = 4 * w_b * np.sum(A_R - S_T, axis=-3)
         # G = optimizer.update(G)
-        U = np.einsum("...ij, ...jk -> ...ik", U, mat_exp(eta * eps * G))
+        U = np.einsum("...ij, ...jk -> ...ik", U, unitary_update(eta * eps * G, method=update))
 
         U_conj_trans = np.transpose(U, axes=(0,1,3,2)).conj()
         for idx, idx_vec in enumerate(idx_shell[0]):
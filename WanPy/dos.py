@@ -0,0 +1,263 @@
+import numpy as np
+from itertools import permutations, product
+from scipy.special import erf
+from scipy.sparse import coo_matrix
+
+# Streaming density of states. Eigenvalues are binned chunk by chunk into a fixed energy grid, so
+# the eigenvalues of a fine mesh never have to be held at once. The DOS is normalized per k-point,
+# g(E) = 1/N_k sum_{n,k} delta(E - E_{nk}), and integrates to the number of bands. Every bin holds
+# the weight of the broadened delta functions integrated over the bin, divided by its width.
+
+
+def _simplex_cdf(x, e):
+    """
+    Fraction of a simplex where the linear interpolation of the corner energies is below x.
+
+    Args:
+        x (np.ndarray): energies [..., m]
+        e (np.ndarray): sorted corner energies [..., d + 1] of a d-simplex, d = 1, 2 or 3
+
+    Returns:
+        C (np.ndarray): shape [..., m]
+    """
+    d = e.shape[-1] - 1
+    assert d in [1, 2, 3], "Linear tetrahedron method is implemented for 1, 2 and 3 dimensions"
+    e = [e[..., i, np.newaxis] for i in range(d + 1)]
+
+    def frac(num, *dens):
+        den = np.prod(dens, axis=0)
+        # only evaluated where every factor of den is positive, see the conditions below
+        return num / np.where(den > 0, den, 1)
+
+    C = np.where(x >= e[d], 1.0, 0.0)
+    if d == 1:
+        C = np.where((e[0] <= x) & (x < e[1]), frac(x - e[0], e[1] - e[0]), C)
+    elif d == 2:
+        C = np.where(
+            (e[0] <= x) & (x < e[1]), frac((x - e[0]) ** 2, e[1] - e[0], e[2] - e[0]), C)
+        C = np.where(
+            (e[1] <= x) & (x < e[2]), 1 - frac((e[2] - x) ** 2, e[2] - e[0], e[2] - e[1]), C)
+    else:
+        # Bloechl, Jepsen and Andersen, PRB 49, 16223 (1994)
+        C = np.where(
+            (e[0] <= x) & (x < e[1]), frac((x - e[0]) ** 3, e[1] - e[0], e[2] - e[0], e[3] - e[0]), C)
+        e_21, x_2 = e[1] - e[0], x - e[1]
+        C_mid = e_21 ** 2 + 3 * e_21 * x_2 + 3 * x_2 ** 2 - frac(
+            (e[2] - e[0] + e[3] - e[1]) * x_2 ** 3, e[2] - e[1], e[3] - e[1])
+        C = np.where((e[1] <= x) & (x < e[2]), frac(C_mid, e[2] - e[0], e[3] - e[0]), C)
+        C = np.where(
+            (e[2] <= x) & (x < e[3]), 1 - frac((e[3] - x) ** 3, e[3] - e[0], e[3] - e[1], e[3] - e[2]), C)
+    return C
+
+
+def _kuhn_simplices(d):
+    """
+    Corners of the d! simplices of the Kuhn triangulation of the unit d-cube.
+
+    Each simplex walks from the origin to (1, ..., 1) along the axes in the order of a permutation.
+    Triangulating neighboring cubes the same way makes the interpolation continuous across them.
+
+    Returns:
+        simplices (list[list[tuple]]): d! lists of d + 1 corners in {0, 1}^d
+    """
+    simplices = []
+    for perm in permutations(range(d)):
+        corner = [0] * d
+        corners = [tuple(corner)]
+        for ax in perm:
+            corner[ax] = 1
+            corners.append(tuple(corner))
+        simplices.append(corners)
+    return simplices
+
+
+class DOS_accumulator:
+    def __init__(self, energies, method: str = "tetrahedron", sigma=None, n_proj=None, block_size: int = 2 ** 18):
+        """
+        Density of states accumulated from chunks of eigenvalues.
+
+        With "gaussian", each eigenvalue is broadened by a normalized Gaussian of width `sigma` and the
+        chunks can hold any set of k-points. With "tetrahedron", the energies are linearly interpolated
+        over the simplices of the Kuhn triangulation of the periodic uniform mesh. The chunks are then
+        consecutive slabs of the mesh along its first axis, e.g. those of `Interp_model.iter_mesh`. Only
+        the last row of the previous slab and the first row of the mesh are kept, to close the cells
+        between slabs and across the boundary of the Brillouin zone.
+
+        Projected DOS onto n_proj states (e.g. Wannier functions or orbitals) are accumulated
+        alongside, with the weights |<w_m|psi_{nk}>|^2 of each eigenstate.
+
+        Args:
+            energies (np.ndarray):
+                Uniformly spaced energies the DOS is evaluated at, the centers of the bins.
+            method (str):
+                "tetrahedron" (linear tetrahedron) or "gaussian". Defaults to "tetrahedron".
+            sigma (float, optional):
+                Width of the Gaussians. Defaults to two bin widths.
+            n_proj (int, optional):
+                Number of projections. Defaults to None, for the total DOS only.
+            block_size (int):
+                Number of eigenvalues (or simplices) binned at once, bounding the work arrays.
+                Defaults to 2^18.
+        """
+        assert method in ["gaussian", "tetrahedron"], "method must be 'gaussian' or 'tetrahedron'"
+        self.energies: np.ndarray = np.asarray(energies, dtype=float)
+        assert self.energies.ndim == 1 and self.energies.size > 1, "energies must be a 1D grid"
+        self.dE: float = (self.energies[-1] - self.energies[0]) / (self.energies.size - 1)
+        assert self.dE > 0 and np.allclose(np.diff(self.energies), self.dE), "energies must be uniformly spaced"
+        self.n_bins: int = self.energies.size
+        self._edge_0: float = self.energies[0] - self.dE / 2
+
+        self.method: str = method
+        self.sigma: float = 2 * self.dE if sigma is None else sigma
+        self.n_proj = n_proj
+        self.block_size: int = block_size
+        self.reset()
+
+    def reset(self):
+        """Forgets the eigenvalues added so far."""
+        self.n_k: int = 0  # number of k-points, the normalization of the DOS
+        self._counts = np.zeros(self.n_bins)
+        self._proj_counts = None if self.n_proj is None else np.zeros((self.n_proj, self.n_bins))
+        # rows kept to close the cells between slabs ("tetrahedron")
+        self._first = None
+        self._last = None
+        self._closed = False
+
+    def _edge(self, idx):
+        return self._edge_0 + idx * self.dE
+
+    def _deposit(self, bins, weights, proj=None):
+        """
+        Adds `weights` [n, m] to `bins` [n, m], dropping those outside of the grid.
+
+        The projected counts get the weights times the projections `proj` [n, n_proj] of each of
+        the n eigenstates (or simplices), as one sparse product of the bins x n matrix with `proj`.
+        """
+        inside = (bins >= 0) & (bins < self.n_bins)
+        self._counts += np.bincount(bins[inside], weights=weights[inside], minlength=self.n_bins)
+        if proj is not None:
+            items = np.broadcast_to(np.arange(bins.shape[0])[:, np.newaxis], bins.shape)[inside]
+            S = coo_matrix((weights[inside], (bins[inside], items)), shape=(self.n_bins, bins.shape[0]))
+            self._proj_counts += (S.tocsr() @ proj).T
+
+    def add(self, eigvals, proj=None):
+        """
+        Bins a chunk of eigenvalues.
+
+        Args:
+            eigvals (np.ndarray):
+                Energies [..., n_bands]. For "tetrahedron", a slab [n_rows, nk_2, ..., n_bands] of the mesh
+                following the slab added before.
+            proj (np.ndarray, optional):
+                Projections [..., n_bands, n_proj] of the eigenstates, e.g. |eigvecs|^2 transposed.
+        """
+        assert not self._closed, "Mesh was closed by `get_dos`, call `reset` first"
+        assert (proj is None) == (self.n_proj is None), "proj must be given exactly when n_proj is set"
+        eigvals = np.asarray(eigvals, dtype=float)
+        if proj is not None:
+            proj = np.asarray(proj, dtype=float)
+            assert proj.shape == (*eigvals.shape, self.n_proj), "proj must be [..., n_bands, n_proj]"
+
+        if self.method == "gaussian":
+            self.n_k += eigvals[..., 0].size
+            self._add_gaussian(eigvals.reshape(-1), None if proj is None else proj.reshape(-1, self.n_proj))
+            return
+
+        assert eigvals.ndim - 1 in [1, 2, 3], "Linear tetrahedron method is implemented for 1, 2 and 3 dimensions"
+        if self._first is None:
+            self._first = (eigvals[:1].copy(), None if proj is None else proj[:1].copy())
+        else:
+            assert eigvals.shape[1:] == self._first[0].shape[1:], "Slabs must be of the same mesh"
+            # prepend the last row of the previous slab for the cells in between
+            eigvals = np.concatenate([self._last[0], eigvals])
+            if proj is not None:
+                proj = np.concatenate([self._last[1], proj])
+        self.n_k += eigvals[1:, ..., 0].size if self._last is not None else eigvals[..., 0].size
+        self._last = (eigvals[-1:].copy(), None if proj is None else proj[-1:].copy())
+        if eigvals.shape[0] > 1:
+            self._add_cells(eigvals, proj)
+
+    def _add_gaussian(self, e, proj=None):
+        # bins within `cutoff` widths of each eigenvalue, integrated exactly with erf
+        cutoff = 6 * self.sigma
+        n_win = int(np.ceil(2 * cutoff / self.dE)) + 1
+        for lo in range(0, e.size, max(1, self.block_size // n_win)):
+            e_blk = e[lo: lo + max(1, self.block_size // n_win)]
+            first = np.floor((e_blk - cutoff - self._edge_0) / self.dE).astype(int)
+            edge_idx = first[:, np.newaxis] + np.arange(n_win + 1)
+            cdf = erf((self._edge(edge_idx) - e_blk[:, np.newaxis]) / (np.sqrt(2) * self.sigma)) / 2
+            self._deposit(edge_idx[:, :-1], np.diff(cdf, axis=-1), None if proj is None else proj[lo: lo + e_blk.size])
+
+    def _add_cells(self, eigvals, proj=None):
+        """Bins the simplices of the cells between consecutive rows of `eigvals` [n_rows, nk_2, ..., n_bands]."""
+        d = eigvals.ndim - 1
+        n_rows = eigvals.shape[0] - 1
+
+        # energies at the corners c of each cell, periodic along all but the first axis
+        def corner(arr, c):
+            arr = arr[c[0]: c[0] + n_rows]
+            return np.roll(arr, [-s for s in c[1:]], axis=list(range(1, d))) if d > 1 else arr
+
+        corners = {c: corner(eigvals, c) for c in product([0, 1], repeat=d)}
+
+        simplices = _kuhn_simplices(d)
+        for simplex in simplices:
+            e = np.stack([corners[c] for c in simplex], axis=-1).reshape(-1, d + 1)
+            p = None
+            if proj is not None:
+                # projections are averaged over the corners, rolled one corner at a time
+                p = sum(corner(proj, c) for c in simplex).reshape(-1, self.n_proj) / (d + 1)
+            self._add_simplices(np.sort(e, axis=-1), p, weight=1 / len(simplices))
+
+    def _add_simplices(self, e, proj=None, weight=1.0):
+        """
+        Bins simplices with sorted corner energies `e` [n, d + 1], each of volume `weight`.
+
+        The weight of a bin is C(E_hi) - C(E_lo) with C the cumulative fraction `_simplex_cdf`. Only the
+        edges within the range of each simplex are evaluated, most simplices of a fine mesh fall
+        within a single bin.
+        """
+        # index of the first bin edge at or above the lowest and highest corner
+        lo = np.ceil((e[:, 0] - self._edge_0) / self.dE).astype(int)
+        span = np.ceil((e[:, -1] - self._edge_0) / self.dE).astype(int) - lo
+
+        within = span == 0
+        self._deposit((lo[within] - 1)[:, np.newaxis], np.full((np.count_nonzero(within), 1), weight),
+                      None if proj is None else proj[within])
+
+        # remaining simplices grouped by the number of edges they span
+        idx = np.nonzero(~within)[0]
+        group = np.ceil(np.log2(span[idx])).astype(int)
+        for g in np.unique(group):
+            sel = idx[group == g]
+            n_edges = int(span[sel].max())
+            for blk_lo in range(0, sel.size, max(1, self.block_size // n_edges)):
+                blk = sel[blk_lo: blk_lo + max(1, self.block_size // n_edges)]
+                edge_idx = lo[blk, np.newaxis] + np.arange(n_edges)
+                C = _simplex_cdf(self._edge(edge_idx), e[blk])
+                C = np.concatenate([np.zeros((blk.size, 1)), C, np.ones((blk.size, 1))], axis=-1)
+                bins = np.concatenate([edge_idx - 1, edge_idx[:, -1:]], axis=-1)
+                self._deposit(bins, weight * np.diff(C, axis=-1), None if proj is None else proj[blk])
+
+    def close(self):
+        """Adds the cells between the last and first rows of the mesh ("tetrahedron")."""
+        if self.method == "tetrahedron" and not self._closed and self._first is not None:
+            eigvals = np.concatenate([self._last[0], self._first[0]])
+            proj = None if self.n_proj is None else np.concatenate([self._last[1], self._first[1]])
+            self._add_cells(eigvals, proj)
+        self._closed = True
+
+    def get_dos(self):
+        """
+        Density of states at `energies`, closing the mesh for "tetrahedron".
+
+        Returns:
+            dos (np.ndarray): Shape is n_energies.
+            pdos (np.ndarray): Shape is n_proj x n_energies. Only if `n_proj` is set.
+        """
+        assert self.n_k > 0, "No eigenvalues were added"
+        self.close()
+        norm = 1 / (self.n_k * self.dE)
+        if self.n_proj is None:
+            return self._counts * norm
+        return self._counts * norm, self._proj_counts * norm
@@ -0,0 +1,95 @@
+import numpy as np
+
+# Mixing schemes for the disentanglement fixed point. An iteration maps the averaged neighbor
+# projector P_avg = sum_b w_b P_{k+b} onto a new one through the eigenvectors of Z_k. The mixer
+# proposes the input of the next iteration from the input x and output g(x) of the current one.
+
+
+def inner(X, Y):
+    """Real inner product Re sum(X^* Y) of two arrays."""
+    return np.real(np.vdot(X, Y))
+
+
+class LinearMixer:
+    def __init__(self, alpha=1):
+        """
+        Linear mixing, x_{i+1} = (1 - alpha) x_i + alpha g(x_i).
+
+        Args:
+            alpha (float): fraction of the output kept. alpha = 1 is the plain fixed point iteration.
+        """
+        self.alpha = alpha
+        self.reset()
+
+    def reset(self):
+        """Forgets the mixing history."""
+        pass
+
+    def mix(self, x_in, x_out):
+        """
+        Next input from the input and output of the current iteration.
+
+        `x_in` is updated in place and returned. `x_out` may be overwritten.
+        """
+        x_in *= (1 - self.alpha)
+        x_out *= self.alpha
+        x_in += x_out
+        return x_in
+
+
+class AndersonMixer(LinearMixer):
+    def __init__(self, alpha=1, history=5, reg=1e-12):
+        """
+        Anderson (Pulay/DIIS) mixing on the residuals f_i = g(x_i) - x_i.
+
+        With the differences dX_j = x_{j+1} - x_j and dF_j = f_{j+1} - f_j of the last `history`
+        iterations, the coefficients gamma minimize |f_i - sum_j gamma_j dF_j| and
+        x_{i+1} = x_i + alpha f_i - sum_j gamma_j (dX_j + alpha dF_j).
+
+        Args:
+            alpha (float): linear mixing applied to the extrapolated residual. Defaults to 1.
+            history (int): number of previous iterations kept. Defaults to 5.
+            reg (float): relative Tikhonov regularization of the least squares problem. Defaults to 1e-12.
+        """
+        self.history = history
+        self.reg = reg
+        super().__init__(alpha=alpha)
+
+    def reset(self):
+        self._dX, self._dF = [], []
+        self._x_prev = None
+        self._f_prev = None
+
+    def mix(self, x_in, x_out):
+        f = x_out - x_in
+        if self._x_prev is not None:
+            self._dX.append(x_in - self._x_prev)
+            self._dF.append(f - self._f_prev)
+            if len(self._dX) > self.history:
+                self._dX.pop(0)
+                self._dF.pop(0)
+        self._x_prev, self._f_prev = np.copy(x_in), f
+
+        x_new = x_in + self.alpha * f
+        if len(self._dF) > 0:
+            # normal equations of the least squares problem, at most `history` x `history`
+            gram = np.array([[inner(dFi, dFj) for dFj in self._dF] for dFi in self._dF])
+            rhs = np.array([inner(dFi, f) for dFi in self._dF])
+            gram += self.reg * np.trace(gram) * np.eye(len(self._dF))
+            gamma = np.linalg.lstsq(gram, rhs, rcond=None)[0]
+            for g, dX, dF in zip(gamma, self._dX, self._dF):
+                x_new -= g * (dX + self.alpha * dF)
+        x_in[...] = x_new
+        return x_in
+
+
+_mixers: dict = {"linear": LinearMixer, "anderson": AndersonMixer}
+
+
+def get_mixer(name: str, alpha=1, **kwargs):
+    """
+    Returns the mixer "linear" or "anderson". Extra keyword arguments are passed to the mixer,
+    e.g. `history` for "anderson".
+    """
+    assert name in _mixers, f"mixing must be one of {list(_mixers)}"
+    return _mixers[name](alpha=alpha, **kwargs)
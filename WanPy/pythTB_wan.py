@@ -1,16 +1,236 @@
 from pythtb import *
 from typing import TYPE_CHECKING
+import atexit
+import warnings
 import numpy as np
 from itertools import product
 from itertools import combinations_with_replacement as comb
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import matplotlib.pyplot as plt
 from matplotlib.colors import LogNorm
 
+try:
+    from .unitary import unitary_update, exp_general, exp_antiherm, get_optimizer
+    from .mixing import get_mixer
+    from .dos import DOS_accumulator
+except ImportError:  # imported as a top-level module with WanPy on the path
+    from unitary import unitary_update, exp_general, exp_antiherm, get_optimizer
+    from mixing import get_mixer
+    from dos import DOS_accumulator
+
 
 if TYPE_CHECKING:
     from pythtb import tb_model, wf_array
 
 
+# The geometry of a k-mesh (k-shells, finite difference weights, boundary and orbital phases) only
+# depends on the lattice vectors, the orbitals and the number of k-points. It is computed once per
+# geometry and shared by every K_mesh, e.g. the meshes of a Wannier object and its Bloch states.
+# The cached arrays are read-only, and only the `_geometry_cache_size` most recently used geometries
+# are kept. Meshes created before an eviction keep their own reference to the geometry.
+_geometry_cache: dict = {}
+_geometry_cache_size: int = 8
+
+# Working precision of the states, overlaps, projectors and unitaries. "single" halves the memory
+# and roughly doubles the BLAS throughput at the cost of ~1e-7 relative accuracy.
+_precision_dtypes: dict = {"double": np.complex128, "single": np.complex64}
+# Products of single precision unitaries drift from unitary by ~1e-7 per step. The gauge minimization
+# projects U back onto the unitaries, and rotates the overlaps again, every this many steps.
+_single_reunitarize_steps: int = 10
+
+def clear_geometry_cache():
+    """Drops the memoized k-mesh geometries. Existing `K_mesh` objects keep theirs."""
+    _geometry_cache.clear()
+
+
+def _freeze(value):
+    """Marks the arrays of a cached value (possibly nested in lists and tuples) read-only."""
+    if isinstance(value, np.ndarray):
+        value.flags.writeable = False
+    elif isinstance(value, (list, tuple)):
+        for v in value:
+            _freeze(v)
+    return value
+
+
+# Thread pools reused by every chunked per-k kernel, one per number of threads. They are shut down
+# when the interpreter exits.
+_thread_pools: dict = {}
+
+
+@atexit.register
+def _shutdown_thread_pools():
+    for pool in _thread_pools.values():
+        pool.shutdown(wait=True)
+    _thread_pools.clear()
+
+
+def map_k_chunks(func, *arrays, dim_k: int, n_threads: int = 1, out=None):
+    """
+    Applies a per-k kernel to chunks of the k-mesh dispatched to a thread pool.
+
+    The leading `dim_k` axes of the arrays are flattened and split into `n_threads` contiguous
+    chunks. NumPy releases the GIL inside its kernels, so the chunks run concurrently.
+
+    Args:
+        func (callable):
+            Kernel acting independently on each k-point, called as func(*chunks) or
+            func(*chunks, out=out_chunk) when `out` is given.
+        arrays (np.ndarray):
+            Arguments of the kernel. Leading `dim_k` axes are the k-mesh.
+        dim_k (int):
+            Number of leading k axes.
+        n_threads (int):
+            Number of threads. With 1, `func` is called once on the full arrays.
+        out (np.ndarray, optional):
+            Output buffer with the same leading k axes. Chunks are written in place, so the 
+            k axes must be mergeable into one axis without a copy.
+
+    Returns:
+        result (np.ndarray | tuple[np.ndarray]): Output of `func` with the k axes restored.
+    """
+    if n_threads == 1:
+        return func(*arrays) if out is None else func(*arrays, out=out)
+
+    nks = arrays[0].shape[:dim_k]
+    Nk = int(np.prod(nks))
+    flat = [a.reshape(Nk, *a.shape[dim_k:]) for a in arrays]
+    bounds = np.linspace(0, Nk, min(n_threads, Nk) + 1).astype(int)
+    chunks = [slice(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    pool = _thread_pools.get(n_threads)
+    if pool is None:
+        pool = _thread_pools[n_threads] = ThreadPoolExecutor(max_workers=n_threads)
+
+    if out is not None:
+        flat_out = out.view()
+        flat_out.shape = (Nk, *out.shape[dim_k:])  # raises instead of silently copying
+        futures = [pool.submit(func, *[a[c] for a in flat], out=flat_out[c]) for c in chunks]
+        for future in futures:
+            future.result()
+        return out
+
+    results = [pool.submit(func, *[a[c] for a in flat]) for c in chunks]
+    results = [future.result() for future in results]
+    if isinstance(results[0], tuple):
+        return tuple(
+            np.concatenate(res, axis=0).reshape(*nks, *res[0].shape[1:]) for res in zip(*results)
+            )
+    return np.concatenate(results, axis=0).reshape(*nks, *results[0].shape[1:])
+
+
+def _outer_states(states, out=None):
+    """Projector sum_n |u_n><u_n| of the states [..., n, orb]."""
+    return np.einsum("...ni, ...nj -> ...ij", states, states.conj(), out=out)
+
+
+def _pad_states(states, mask):
+    """
+    Gathers the states selected at each k-point into an array padded to the largest count.
+
+    Args:
+        states (np.ndarray): states [*nks, n, orb]
+        mask (np.ndarray): selected states [*nks, n]
+
+    Returns:
+        padded (np.ndarray): selected states in their original order, then zero rows [*nks, n_max, orb]
+        valid (np.ndarray): mask of the selected rows [*nks, n_max]
+    """
+    counts = np.sum(mask, axis=-1)
+    n_max = np.max(counts)
+    order = np.argsort(~mask, axis=-1, kind="stable")[..., :n_max]
+    valid = np.arange(n_max) < counts[..., np.newaxis]
+    padded = np.take_along_axis(states, order[..., np.newaxis], axis=-2)
+    padded[~valid] = 0
+    return padded, valid
+
+
+def _rayleigh_ritz_step(Z, X):
+    """
+    One step of block subspace iteration, Z X followed by Rayleigh-Ritz in its span.
+
+    Returns the Ritz vectors and values in ascending order and the residual norms |Z X - X w|.
+    """
+    Q, _ = np.linalg.qr(np.matmul(Z, X))
+    ZQ = np.matmul(Z, Q)
+    w, V = np.linalg.eigh(np.matmul(np.swapaxes(Q, -1, -2).conj(), ZQ))
+    X = np.matmul(Q, V)
+    res = np.linalg.norm(np.matmul(ZQ, V) - X * w[..., np.newaxis, :], axis=(-2, -1))
+    return X, w, res
+
+
+def _top_eigvecs(Z, valid, num_keep, dim_k: int, n_threads: int = 1, X=None, tol=1e-10, max_iter=4):
+    """
+    Eigenvectors of Z with the `num_keep` largest eigenvalues at each k-point.
+
+    Z is positive semidefinite in a (zero padded) basis. Its padding is shifted to the eigenvalue
+    -1 so that it is never selected. Z is overwritten.
+
+    Without `X`, all eigenvectors are computed with `np.linalg.eigh`. If `X` holds the top 
+    eigenvectors of a nearby Z, e.g. from the previous disentanglement iteration, they seed a block
+    subspace iteration costing O(n^2 max(num_keep)) per k-point instead of O(n^3). It runs until the
+    residuals |Z x - lambda x| are below `tol` times the largest eigenvalue. k-points where the residual
+    stalls (decreases by less than a factor of 2 in a step) or that do not converge in `max_iter` 
+    steps fall back to `np.linalg.eigh`.
+
+    Args:
+        Z (np.ndarray): Hermitian matrices in the basis [*nks, n, n]
+        valid (np.ndarray): valid basis states [*nks, n]
+        num_keep (int | np.ndarray): number of eigenvectors kept at each k-point
+        X (np.ndarray, optional): starting vectors [*nks, n, max(num_keep)], see the second return value
+        tol (float): relative residual of the subspace iteration. Defaults to 1e-10.
+        max_iter (int): maximum number of subspace iteration steps. Defaults to 4.
+
+    Returns:
+        C (np.ndarray): 
+            Eigenvectors as columns in ascending order of the eigenvalues [*nks, n, max(num_keep)]. 
+            At k-points keeping fewer states the leading columns are zero.
+        X (np.ndarray): 
+            The top max(num_keep) eigenvectors at every k-point, to seed the next call.
+    """
+    nks, n, n_keep = Z.shape[:-2], Z.shape[-1], np.max(num_keep)
+    if not np.all(valid):
+        Z[..., np.arange(n), np.arange(n)] -= ~valid
+
+    if X is None:
+        _, eigvecs = map_k_chunks(np.linalg.eigh, Z, dim_k=dim_k, n_threads=n_threads) # [val, idx]
+        X = eigvecs[..., n - n_keep:]
+    else:
+        Nk = int(np.prod(nks))
+        Z_flat = Z.reshape(Nk, n, n)
+        X = np.array(X).reshape(Nk, n, n_keep)
+        res = np.full(Nk, np.inf)
+        active = np.arange(Nk)  # k-points still converging
+        for _ in range(max_iter):
+            X_a, w_a, res_a = map_k_chunks(
+                _rayleigh_ritz_step, Z_flat[active], X[active], dim_k=1, n_threads=n_threads)
+            res_a /= np.maximum(np.max(abs(w_a), axis=-1), np.finfo(res_a.dtype).tiny)
+            X[active] = X_a
+            converging = (res_a > tol) & (res_a < res[active] / 2)
+            res[active] = res_a
+            active = active[converging]
+            if len(active) == 0:
+                break
+
+        stalled = np.flatnonzero(res > tol)
+        if len(stalled) > 0:
+            _, eigvecs = map_k_chunks(np.linalg.eigh, Z_flat[stalled], dim_k=1, n_threads=n_threads)
+            X[stalled] = eigvecs[..., n - n_keep:]
+        X = X.reshape(*nks, n, n_keep)
+
+    C = X
+    if not np.all(num_keep == n_keep):
+        C = X * (np.arange(n_keep) >= (n_keep - num_keep)[..., np.newaxis])[..., np.newaxis, :]
+    return C, X
+
+
+def _sum_outer(A, out=None):
+    """sum_b A_b A_b^dagger of the matrices A [..., b, n, m]."""
+    A = np.moveaxis(A, -3, -2)
+    A = A.reshape(*A.shape[:-2], A.shape[-2] * A.shape[-1])
+    return np.matmul(A, np.swapaxes(A, -1, -2).conj(), out=out)
+
+
 class Lattice():
     def __init__(self, model: tb_model):
         self._orbs = model.get_orb()
@@ -77,11 +297,31 @@ class K_mesh():
                 list of vectors of integers that connect the indices of a k-point and neighboring k-points.
             num_nnbrs (int):
                 number of nearest neighbor k-points.
+            nnbr_idx (np.ndarray):
+                Flat index of the neighbor k+b of each flat k-index. Shape is Nk x num_nnbrs.
+            bc_mask (np.ndarray):
+                True where the neighbor k+b lies across the BZ boundary. Shape is Nk x num_nnbrs.
+            n_threads (int):
+                Number of threads used by the chunked per-k kernels. Defaults to 1.
         """
         self.Lattice: Lattice = Lattice(model)
         self.nks = nks
         self.dim: int = len(nks)
-        self.idx_arr: list = list(product(*[range(nk) for nk in nks]))  # 1D list of all k_indices
+        self.n_threads: int = 1
+
+        # geometry shared with all meshes of the same lattice, orbitals and nks
+        key = (
+            self.Lattice._lat_vecs.tobytes(), self.Lattice._orbs.tobytes(),
+            self.Lattice._orbs.shape, tuple(nks)
+            )
+        self._geometry: dict = _geometry_cache.pop(key, {})
+        _geometry_cache[key] = self._geometry  # most recently used last
+        while len(_geometry_cache) > _geometry_cache_size:
+            del _geometry_cache[next(iter(_geometry_cache))]
+
+        if "idx_arr" not in self._geometry:
+            self._geometry["idx_arr"] = list(product(*[range(nk) for nk in nks]))
+        self.idx_arr: list = self._geometry["idx_arr"]  # 1D list of all k_indices
         self.full_mesh: np.ndarray = self.gen_k_mesh(flat=False, endpoint=False)
         self.flat_mesh: np.ndarray = self.gen_k_mesh(flat=True, endpoint=False)
 
@@ -93,6 +333,9 @@ class K_mesh():
         self.bc_phase = self.get_boundary_phase()
         self.orb_phases = self.get_orb_phases()
 
+        # gather table (k, b) -> k+b with the boundary phases of the wrapped entries
+        self.nnbr_idx, self.bc_mask, self.bc_rows = self.get_nbr_idx()
+
     def gen_k_mesh(
             self, 
             centered: bool = False, 
@@ -116,12 +359,18 @@ class K_mesh():
             k-mesh (np.ndarray): 
                 Array of k-mesh coordinates.
         """
+        key = ("k_mesh", centered, flat, endpoint)
+        if key in self._geometry:
+            return self._geometry[key]
+
         end_pts = [-0.5, 0.5] if centered else [0, 1]
 
         k_vals = [np.linspace(end_pts[0], end_pts[1], nk, endpoint=endpoint) for nk in self.nks]
         mesh = np.array(list(product(*k_vals)))
 
-        return mesh if flat else mesh.reshape(*[nk for nk in self.nks], len(self.nks))
+        mesh = mesh if flat else mesh.reshape(*[nk for nk in self.nks], len(self.nks))
+        self._geometry[key] = _freeze(mesh)
+        return mesh
     
     def get_k_shell(
             self, 
@@ -146,6 +395,10 @@ class K_mesh():
                 Array of vectors of integers used for indexing the nearest neighboring k-mesh points
                 to a given k-mesh point.
         """
+        key = ("k_shell", N_sh)
+        if key in self._geometry and not report:
+            return self._geometry[key]
+
         # basis vectors connecting neighboring mesh points (in inverse lattice vector units)
         dk = np.array([self.Lattice._recip_lat_vecs[i] / nk for i, nk in enumerate(self.nks)])
         # array of integers e.g. in 2D for N_sh = 1 would be [0,1], [1,0], [0,-1], [-1,0]
@@ -181,17 +434,25 @@ class K_mesh():
             dist_degen = {ud: len(k_shell[i]) for i, ud in enumerate(keep_dists)}
             print("k-shell report:")
             print("--------------")
-            print(f"Reciprocal lattice vectors: {self._recip_vecs}")
+            print(f"Reciprocal lattice vectors: {self.Lattice._recip_lat_vecs}")
             print(f"Distances and degeneracies: {dist_degen}")
             print(f"k-shells: {k_shell}")
             print(f"idx-shells: {idx_shell}")
 
+        self._geometry[key] = _freeze((k_shell, idx_shell))
         return k_shell, idx_shell
     
     
     def get_weights(self, N_sh=1, report=False):
         """Generates the finite difference weights on a k-shell.
+
+        The weights are computed once per geometry and afterwards returned from the shared
+        geometry cache, so repeated calls (e.g. when evaluating spreads) are free.
         """
+        key = ("weights", N_sh)
+        if key in self._geometry and not report:
+            return self._geometry[key]
+
         k_shell, idx_shell = self.get_k_shell(N_sh=N_sh, report=report)
         dim_k = len(self.nks)
         Cart_idx = list(comb(range(dim_k), 2))
@@ -213,6 +474,8 @@ class K_mesh():
         w = (Vt.T @ np.linalg.inv(np.diag(D)) @ U.T) @ q
         if report:
             print(f"Finite difference weights: {w}")
+
+        self._geometry[key] = _freeze((w, k_shell, idx_shell))
         return w, k_shell, idx_shell
     
     
@@ -221,33 +484,217 @@ class K_mesh():
         Get phase factors to multiply the cell periodic states in the first BZ
         related by the pbc u_{n, k+G} = u_{n, k} exp(-i G . r)
 
+        The phase only differs from 1 on the slab of k-points whose neighbor k+b is across
+        the BZ boundary. Since exp(-i G . r) factorizes over the components of G, the phase
+        of each neighbor is stored as one orbital phase vector for every reciprocal direction
+        that b wraps around, together with the slab of k-indices it applies to. k-points in
+        the corners are in several slabs and pick up the product of the phases.
+
         Returns:
-            bc_phase (np.ndarray): 
-                The shape is [...k(s), shell_idx] where shell_idx is an integer
-                corresponding to a particular idx_vec where the convention is to go  
-                counter-clockwise (e.g. square lattice 0 --> [1, 0], 1 --> [0, 1] etc.)
-
-        """
-        # k_idx_arr = list(
-        #     product(*[range(nk) for nk in self.nks])
-        # )  # all pairwise combinations of k_indices
-        # k_idx_arr = self.idx_arr
-        idx_shell = self.nnbr_idx_shell
-        bc_phase = np.ones((*self.nks, idx_shell[0].shape[0], self.Lattice._orbs.shape[0]), dtype=complex)
-        for k_idx in self.idx_arr:
-            for shell_idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-                k_nbr_idx = np.array(k_idx) + idx_vec
-                # apply pbc to index
-                mod_idx = np.mod(k_nbr_idx, self.nks)
-                diff = k_nbr_idx - mod_idx
-                G = np.divide(np.array(diff), np.array(self.nks))
-                # if the translated k-index contains -1 or nk_i+1 then we crossed the BZ boundary
-                cross_bndry = np.any((k_nbr_idx == -1) | np.logical_or.reduce([k_nbr_idx == nk for nk in self.nks]))
-                if cross_bndry:
-                    bc_phase[k_idx][shell_idx]= np.exp(-1j * 2 * np.pi * self.Lattice._orbs @ G.T).T
+            bc_phase (list[list[tuple[int, slice, np.ndarray]]]):
+                Indexed as [shell_idx][i] where shell_idx is an integer corresponding to a 
+                particular idx_vec where the convention is to go counter-clockwise 
+                (e.g. square lattice 0 --> [1, 0], 1 --> [0, 1] etc.). Each element is a tuple
+                (axis, slab, phase) with `slab` selecting the k-indices along `axis` that cross
+                the boundary and `phase` the orbital phases of shape n_orb.
+        """
+        if "bc_phase" in self._geometry:
+            return self._geometry["bc_phase"]
 
+        orbs = self.Lattice._orbs
+        bc_phase = []
+        for idx_vec in self.nnbr_idx_shell[0]:  # nearest neighbors
+            slabs = []
+            for axis, shift in enumerate(idx_vec):
+                if shift == 0:
+                    continue
+                nk = self.nks[axis]
+                # the last (first) |shift| k-indices are translated across the boundary by G = +1 (-1)
+                slab = slice(nk - shift, nk) if shift > 0 else slice(0, -shift)
+                phase = np.exp(-1j * 2 * np.pi * orbs[:, axis] * np.sign(shift))
+                slabs.append((axis, slab, phase))
+            bc_phase.append(slabs)
+
+        self._geometry["bc_phase"] = _freeze(bc_phase)
         return bc_phase
     
+    def get_nbr_idx(self):
+        """
+        Flat neighbor table used to gather the states at k+b without rolling the mesh.
+
+        Returns:
+            nnbr_idx (np.ndarray):
+                Flat index of k+b for each flat k-index and neighbor. Shape is Nk x num_nnbrs.
+            bc_mask (np.ndarray):
+                True where k+b is across the BZ boundary. Shape is Nk x num_nnbrs.
+            bc_rows (list[tuple[np.ndarray, np.ndarray]]):
+                For each neighbor, the flat k-indices where `bc_mask` is True and the phases
+                exp(-i G . r) of the orbitals at those k-points. Shapes are n_bdry and n_bdry x n_orb.
+        """
+        if "nnbr_idx" in self._geometry:
+            return self._geometry["nnbr_idx"]
+
+        nks = np.array(self.nks)
+        k_idx = np.array(self.idx_arr, dtype=int).reshape(-1, self.dim)  # [k, dim]
+        idx_shell = self.nnbr_idx_shell[0]
+
+        k_nbr_idx = k_idx[:, np.newaxis, :] + idx_shell[np.newaxis, :, :]  # [k, b, dim]
+        nnbr_idx = np.ravel_multi_index(tuple(np.moveaxis(np.mod(k_nbr_idx, nks), -1, 0)), self.nks)
+        bc_mask = np.any((k_nbr_idx < 0) | (k_nbr_idx >= nks), axis=-1)
+
+        bc_rows = []
+        for idx, slabs in enumerate(self.bc_phase):
+            rows = np.flatnonzero(bc_mask[:, idx])
+            phase = np.ones((rows.shape[0], self.Lattice._n_orb), dtype=complex)
+            # corners lie in the slabs of several directions and pick up the product of phases
+            for axis, slab, phase_ax in slabs:
+                in_slab = np.zeros(self.nks[axis], dtype=bool)
+                in_slab[slab] = True
+                phase[in_slab[k_idx[rows, axis]]] *= phase_ax
+            bc_rows.append((rows, phase))
+
+        self._geometry["nnbr_idx"] = _freeze((nnbr_idx, bc_mask, bc_rows))
+        return nnbr_idx, bc_mask, bc_rows
+
+    def get_nbr_states(self, states, idx, out=None):
+        """
+        Returns the states at the neighboring k-points, u_{n, k+b}, for the neighbor
+        with shell index idx, including the phase picked up across the BZ boundary.
+
+        Args:
+            states (np.ndarray):
+                Cell periodic states defined on the k-mesh. Shape is [*nks, ..., orb].
+            idx (int):
+                Index of the neighbor in the nearest neighbor shell.
+            out (np.ndarray, optional):
+                Contiguous buffer with the shape and dtype of `states` to gather into,
+                so loops over neighbors can reuse one allocation.
+
+        Returns:
+            states_pbc (np.ndarray):
+                States at k+b. Same shape as `states`.
+        """
+        Nk = np.prod(self.nks)
+        flat = states.reshape(Nk, *states.shape[self.dim:])
+        if out is None:
+            out = np.empty_like(flat)
+        else:
+            out = out.reshape(flat.shape)
+
+        np.take(flat, self.nnbr_idx[:, idx], axis=0, out=out)
+        rows, phase = self.bc_rows[idx]
+        out[rows] *= phase.reshape(rows.shape[0], *[1] * (flat.ndim - 2), phase.shape[-1])
+        return out.reshape(states.shape)
+
+    def get_overlap_mat(self, states, nbr_states=None, out=None):
+        """
+        Overlap matrices M_{m,n,k,b} = <u_{m, k} | v_{n, k+b}> between the states at each k-point
+        and the states at its neighbors, including the phase across the BZ boundary.
+
+        Args:
+            states (np.ndarray):
+                Cell periodic states |u_{m, k}>. Shape is [*nks, n_m, orb].
+            nbr_states (np.ndarray, optional):
+                Cell periodic states |v_{n, k}> evaluated at k+b. Shape is [*nks, n_n, orb].
+                Defaults to `states`.
+            out (np.ndarray, optional):
+                Buffer of shape [*nks, num_nnbrs, n_m, n_n] to write the overlaps into.
+
+        Returns:
+            M (np.ndarray): 
+                Overlap matrix. Shape is [*nks, num_nnbrs, n_m, n_n].
+        """
+        if nbr_states is None:
+            nbr_states = states
+        if out is None:
+            out = np.empty(
+                (*self.nks, self.num_nnbrs, states.shape[-2], nbr_states.shape[-2]), 
+                dtype=np.result_type(states, nbr_states)
+                )
+
+        states_conj = states.conj()
+        states_pbc = np.empty(nbr_states.shape, dtype=nbr_states.dtype)  # reused for each neighbor
+        for idx in range(self.num_nnbrs):  # nearest neighbors
+            # introduce phases to states when k+b is across the BZ boundary
+            self.get_nbr_states(nbr_states, idx, out=states_pbc)
+            map_k_chunks(
+                np.matmul, states_conj, np.swapaxes(states_pbc, -1, -2), 
+                dim_k=self.dim, n_threads=self.n_threads, out=out[..., idx, :, :]
+                )
+        return out
+
+    def get_nbr_gauge(self, U, idx=None, out=None):
+        """
+        Returns the k-dependent matrices U_{k+b} at all neighbors of each k-point. 
+        Unlike states, gauge transformations are periodic and pick up no boundary phase.
+
+        Args:
+            U (np.ndarray):
+                Matrices defined on the k-mesh. Shape is [*nks, n, m].
+            idx (int, optional):
+                Index of a single neighbor in the nearest neighbor shell. Defaults to all neighbors.
+            out (np.ndarray, optional):
+                Buffer of shape [*nks, num_nnbrs, n, m] ([*nks, n, m] for a single neighbor) to gather into.
+
+        Returns:
+            U_nbr (np.ndarray):
+                Shape is [*nks, num_nnbrs, n, m], or [*nks, n, m] for a single neighbor.
+        """
+        Nk = np.prod(self.nks)
+        flat = U.reshape(Nk, *U.shape[self.dim:])
+        nbr_idx = self.nnbr_idx if idx is None else self.nnbr_idx[:, idx]
+        shape = (*nbr_idx.shape, *U.shape[self.dim:])
+        out = np.empty(shape, dtype=U.dtype) if out is None else out.reshape(shape)
+        np.take(flat, nbr_idx, axis=0, out=out)
+        return out.reshape(*self.nks, *shape[1:])
+
+    def get_WS_R_vecs(self, search_size: int = 2, tol: float = 1e-6):
+        """
+        Lattice vectors in the Wigner-Seitz cell of the supercell of the mesh, with their degeneracies.
+
+        Quantities on an nk_1 x nk_2 ... mesh fix their Fourier components only up to the supercell
+        translations T = (m_1 nk_1, m_2 nk_2, ...). For interpolation, each R is represented by its 
+        images closest to the origin (in Cartesian distance). Vectors on the boundary of the Wigner-Seitz 
+        cell have deg(R) equally close images, each weighted by 1/deg(R). Then sum_R 1/deg(R) = Nk and 
+        the set is symmetric under R -> -R.
+
+        Args:
+            search_size (int): 
+                Candidates R with |R_i| <= search_size * nk_i are compared to the images with
+                |m_i| <= search_size. Defaults to 2.
+            tol (float): 
+                Tolerance for equal distances, relative to the lattice constant. Defaults to 1e-6.
+
+        Returns:
+            R_vecs (np.ndarray): Lattice vectors in reduced coordinates. Shape is n_R x dim_k.
+            deg (np.ndarray): Degeneracy of each vector. Shape is n_R.
+        """
+        key = ("ws_R_vecs", search_size, tol)
+        if key in self._geometry:
+            return self._geometry[key]
+
+        nks = np.array(self.nks)
+        lat_vecs = self.Lattice._lat_vecs[:self.dim]  # periodic directions
+        metric = lat_vecs @ lat_vecs.T
+        eps = tol * np.sqrt(np.max(np.diag(metric)))
+
+        def dist(R):
+            return np.sqrt(np.einsum("ri, ij, rj -> r", R, metric, R))
+
+        R_vecs = np.array(list(product(*[range(-search_size * nk, search_size * nk + 1) for nk in nks])))
+        dist_0 = dist(R_vecs)
+        in_ws = np.ones(R_vecs.shape[0], dtype=bool)
+        deg = np.zeros(R_vecs.shape[0], dtype=int)
+        for m in product(range(-search_size, search_size + 1), repeat=self.dim):
+            dist_T = dist(R_vecs - np.array(m) * nks)
+            in_ws &= dist_T >= dist_0 - eps  # no image is closer to the origin
+            deg += abs(dist_T - dist_0) <= eps
+
+        R_vecs, deg = R_vecs[in_ws], deg[in_ws]
+        assert np.isclose(np.sum(1 / deg), np.prod(nks)), "Wigner-Seitz search incomplete, increase search_size"
+
+        self._geometry[key] = _freeze((R_vecs, deg))
+        return R_vecs, deg
 
     def get_orb_phases(self, inverse=False):
         """Returns exp(\pm i k.tau) factors
@@ -256,6 +703,10 @@ class K_mesh():
             Inverse (bool):
                 If True, multiplies factor of -1 for mutiplying Bloch states to get cell-periodic states. 
         """
+        key = ("orb_phases", inverse)
+        if key in self._geometry:
+            return self._geometry[key]
+
         lam = -1 if inverse else 1  # overall minus if getting cell periodic from Bloch
         per_dir = list(range(self.flat_mesh.shape[-1]))  # list of periodic dimensions
         # slice second dimension to only keep only periodic dimensions in orb
@@ -263,6 +714,7 @@ class K_mesh():
 
         # compute a list of phase factors [k_val, orbital]
         wf_phases = np.exp(lam * 1j * 2 * np.pi * per_orb @ self.flat_mesh.T, dtype=complex).T
+        self._geometry[key] = _freeze(wf_phases)
         return wf_phases  # 1D numpy array of dimension norb
     
     def get_pbc_phase(orbs, G):
@@ -286,28 +738,342 @@ class K_mesh():
         return phase
 
 
+class Hop_table():
+    def __init__(self, model: tb_model):
+        """Compiled hopping representation of a tight-binding model.
+
+        The onsite energies, hopping amplitudes, orbital pairs and hopping vectors are pulled
+        from the pythtb model once. The Bloch Hamiltonian for any batch of k-points is then
+        assembled by a single contraction of the matrix of phases e^{i 2pi k.r} with the
+        hopping amplitudes, instead of calling `model._gen_ham` point by point.
+
+        Attributes:
+            n_orb (int):
+                Number of orbitals (dimension of the Bloch Hamiltonian).
+            onsite (np.ndarray):
+                Onsite energies. Shape is n_orb.
+            hop_vecs (np.ndarray):
+                Vectors r_h in reduced coordinates entering the phase e^{i 2pi k.r_h} of each
+                hopping (periodic components only). Shape is n_hop x dim_k.
+            amp_mat (np.ndarray):
+                Amplitude of each hopping on each orbital pair. Shape is n_hop x n_pair.
+            orb_pairs (np.ndarray):
+                Orbital indices (i, j) of the Hamiltonian matrix elements that are set.
+                Shape is n_pair x 2.
+        """
+        assert model._nspin == 1, "Only spinless models are supported"
+
+        orbs = model.get_orb()
+        hops = model._hoppings
+
+        self.n_orb: int = model.get_num_orbitals()
+        self.onsite: np.ndarray = np.array(model._site_energies, dtype=complex)
+
+        if len(hops) == 0:
+            # H(k) is the diagonal of onsite energies
+            self.hop_vecs: np.ndarray = np.zeros((0, len(model._per)))
+            self.orb_pairs: np.ndarray = np.zeros((0, 2), dtype=int)
+            self.amp_mat: np.ndarray = np.zeros((0, 0), dtype=complex)
+            return
+
+        amps = np.array([h[0] for h in hops], dtype=complex)
+        orb_i = np.array([h[1] for h in hops], dtype=int)
+        orb_j = np.array([h[2] for h in hops], dtype=int)
+        ind_R = np.array([h[3] for h in hops], dtype=float).reshape(len(hops), -1)
+
+        # vector from orbital i to orbital j + R (convention 1 of pythtb)
+        hop_vecs = orbs[orb_j, :] - orbs[orb_i, :] + ind_R
+        self.hop_vecs = hop_vecs[:, model._per]
+
+        # group hoppings connecting the same pair of orbitals so every matrix element is set once
+        pairs, pair_idx = np.unique(np.stack([orb_i, orb_j], axis=-1), axis=0, return_inverse=True)
+        self.orb_pairs = pairs
+        self.amp_mat = np.zeros((len(hops), pairs.shape[0]), dtype=complex)
+        self.amp_mat[np.arange(len(hops)), pair_idx.ravel()] = amps
+
+    def gen_ham(self, k_pts):
+        """Assembles the Bloch Hamiltonian for a batch of k-points.
+
+        Args:
+            k_pts (np.ndarray):
+                k-points in reduced coordinates. Shape is (...) x dim_k, e.g. a full mesh of
+                shape nk_1 x nk_2 ... x dim_k or a flat path of shape n_k x dim_k.
+
+        Returns:
+            H_k (np.ndarray):
+                Bloch Hamiltonian at each k-point. Shape is (...) x n_orb x n_orb.
+        """
+        k_pts = np.asarray(k_pts, dtype=float)
+        batch_shape = k_pts.shape[:-1]
+        k_flat = k_pts.reshape(-1, k_pts.shape[-1])
+        n_orb = self.n_orb
+
+        phases = np.exp(1j * 2 * np.pi * k_flat @ self.hop_vecs.T)  # [k, hop]
+        H_pairs = phases @ self.amp_mat  # [k, pair]
+
+        H_k = np.zeros((k_flat.shape[0], n_orb * n_orb), dtype=complex)
+        i, j = self.orb_pairs[:, 0], self.orb_pairs[:, 1]
+        # every pair appears once, so the fancy-indexed additions do not collide
+        H_k[:, i * n_orb + j] += H_pairs
+        # Hermitian conjugate of every hopping, as is the convention in pythtb
+        H_k[:, j * n_orb + i] += H_pairs.conj()
+        H_k[:, np.arange(n_orb) * (n_orb + 1)] += self.onsite
+
+        return H_k.reshape(*batch_shape, n_orb, n_orb)
+
+
+class Interp_model():
+    def __init__(self, H_R, R_vecs, deg=None, chunk_size: int = 4096):
+        """Wannier interpolated tight-binding model.
+
+        Holds the real space Hamiltonian of a set of Wannier functions and evaluates
+        H(k) = sum_R e^{i 2pi k.R} H(R) / deg(R) for batches of k-points with one product of the
+        matrix of phases with H(R), followed by a batched `eigh`. Obtained from a `Wannier` object
+        with `Wannier.get_interp_model`, after which no further setup is needed per k-point batch.
+
+        Args:
+            H_R (np.ndarray):
+                Real space Hamiltonian <0 m|H|R n>. Shape is n_R x n_wfs x n_wfs.
+            R_vecs (np.ndarray):
+                Lattice vectors R in reduced coordinates. Shape is n_R x dim_k.
+            deg (np.ndarray, optional):
+                Degeneracy of each lattice vector, the number of equivalent images it shares the
+                Hamiltonian with. Defaults to 1 for every R.
+            chunk_size (int):
+                Number of k-points evaluated at once, bounding the memory of the phases and
+                Hamiltonians. Defaults to 4096.
+        """
+        self.H_R: np.ndarray = np.asarray(H_R)
+        self.R_vecs: np.ndarray = np.asarray(R_vecs)
+        self.deg: np.ndarray = np.ones(self.R_vecs.shape[0]) if deg is None else np.asarray(deg)
+        self.n_wfs: int = self.H_R.shape[-1]
+        self.dim: int = self.R_vecs.shape[-1]
+        self.chunk_size: int = chunk_size
+
+        # weights folded into the amplitudes, H(k) is then one product with the phases
+        self._amp_mat = (self.H_R / self.deg[:, np.newaxis, np.newaxis]).reshape(-1, self.n_wfs ** 2)
+
+    def _k_chunks(self, k_pts):
+        """Flattened k-points and slices of at most `chunk_size` of them."""
+        k_flat = np.asarray(k_pts, dtype=float).reshape(-1, self.dim)
+        bounds = list(range(0, k_flat.shape[0], self.chunk_size)) + [k_flat.shape[0]]
+        return k_flat, [slice(lo, hi) for lo, hi in zip(bounds[:-1], bounds[1:])]
+
+    def _gen_ham_flat(self, k_flat):
+        phases = np.exp(1j * 2 * np.pi * k_flat @ self.R_vecs.T)  # [k, R]
+        return (phases @ self._amp_mat).reshape(-1, self.n_wfs, self.n_wfs)
+
+    def get_ham(self, k_pts):
+        """Interpolated Bloch Hamiltonian.
+
+        Args:
+            k_pts (np.ndarray):
+                k-points in reduced coordinates. Shape is (...) x dim_k.
+
+        Returns:
+            H_k (np.ndarray): Shape is (...) x n_wfs x n_wfs.
+        """
+        batch_shape = np.shape(k_pts)[:-1]
+        k_flat, chunks = self._k_chunks(k_pts)
+        H_k = np.empty((k_flat.shape[0], self.n_wfs, self.n_wfs), dtype=np.result_type(self._amp_mat, complex))
+        for c in chunks:
+            H_k[c] = self._gen_ham_flat(k_flat[c])
+        return H_k.reshape(*batch_shape, self.n_wfs, self.n_wfs)
+
+    def solve(self, k_pts, ret_eigvecs=False):
+        """Interpolated energies, and optionally eigenvectors, chunk by chunk.
+
+        Args:
+            k_pts (np.ndarray):
+                k-points in reduced coordinates. Shape is (...) x dim_k.
+            ret_eigvecs (bool):
+                Whether to also return the eigenvectors, as columns in the Wannier basis.
+
+        Returns:
+            eigvals (np.ndarray): Shape is (...) x n_wfs.
+            eigvecs (np.ndarray): Shape is (...) x n_wfs x n_wfs. Only if `ret_eigvecs`.
+        """
+        batch_shape = np.shape(k_pts)[:-1]
+        k_flat, chunks = self._k_chunks(k_pts)
+        eigvals = np.empty((k_flat.shape[0], self.n_wfs))
+        if ret_eigvecs:
+            eigvecs = np.empty((k_flat.shape[0], self.n_wfs, self.n_wfs), dtype=np.result_type(self._amp_mat, complex))
+        for c in chunks:
+            H_k = self._gen_ham_flat(k_flat[c])
+            if ret_eigvecs:
+                eigvals[c], eigvecs[c] = np.linalg.eigh(H_k)
+            else:
+                eigvals[c] = np.linalg.eigvalsh(H_k)
+
+        eigvals = eigvals.reshape(*batch_shape, self.n_wfs)
+        if ret_eigvecs:
+            return eigvals, eigvecs.reshape(*batch_shape, self.n_wfs, self.n_wfs)
+        return eigvals
+
+    def iter_mesh(self, nks, n_rows=None, ret_eigvecs=False, ret_ham=False):
+        """Interpolation onto the uniform mesh k = (n_1/nk_1, n_2/nk_2, ...) in slabs, by zero padded FFTs.
+
+        H(R)/deg(R) is placed on an nk_2 x nk_3 ... grid at R mod nk and Fourier transformed along all 
+        but the first axis once. Each slab of `n_rows` values of n_1 is then one product of the phases 
+        e^{i 2pi n_1 R_1/nk_1} with the transform, followed by a batched `eigh`. Only one slab of 
+        Hamiltonians is held at a time, so meshes much denser than the Wannierization mesh fit in memory.
+
+        Args:
+            nks (list[int]): 
+                Number of k-points along each reciprocal lattice vector. The mesh is that of 
+                `K_mesh.gen_k_mesh`.
+            n_rows (int, optional): 
+                Number of values of the first index per slab. Defaults to the most that keeps a slab 
+                within `chunk_size` k-points.
+            ret_eigvecs (bool): Whether to also yield the eigenvectors.
+            ret_ham (bool): Whether to yield the Hamiltonians instead of diagonalizing them.
+
+        Yields:
+            rows (slice): 
+                Values of the first index of the slab.
+            H_k | eigvals (np.ndarray): 
+                Shape is n_rows x nk_2 ... x n_wfs (x n_wfs for H_k).
+            eigvecs (np.ndarray): 
+                Shape is n_rows x nk_2 ... x n_wfs x n_wfs. Only if `ret_eigvecs`.
+        """
+        nks = tuple(nks)
+        assert len(nks) == self.dim, "Mesh dimension must match the lattice vectors"
+        n = self.n_wfs
+        if n_rows is None:
+            n_rows = max(1, self.chunk_size // int(np.prod(nks[1:])))
+
+        # sum over R_2, R_3 ... done once by an FFT of the zero padded grid
+        R_1, R_1_idx = np.unique(self.R_vecs[:, 0], return_inverse=True)
+        H_R_1 = np.zeros((len(R_1), *nks[1:], n, n), dtype=np.result_type(self._amp_mat, complex))
+        grid_idx = (self.R_vecs[:, 1:] % np.array(nks[1:], dtype=int)).T
+        np.add.at(H_R_1, (R_1_idx, *grid_idx), self._amp_mat.reshape(-1, n, n))
+        if self.dim > 1:
+            # ifftn has e^{+i 2pi n.R/nk} and a factor 1/prod(nk)
+            H_R_1 = np.fft.ifftn(H_R_1, axes=list(range(1, self.dim))) * np.prod(nks[1:])
+        H_R_1 = H_R_1.reshape(len(R_1), -1)
+
+        for lo in range(0, nks[0], n_rows):
+            rows = slice(lo, min(lo + n_rows, nks[0]))
+            phases = np.exp(1j * 2 * np.pi * np.outer(np.arange(nks[0])[rows], R_1) / nks[0])  # [n_1, R_1]
+            H_k = (phases @ H_R_1).reshape(-1, *nks[1:], n, n)
+            if ret_ham:
+                yield rows, H_k
+            elif ret_eigvecs:
+                yield (rows, *np.linalg.eigh(H_k))
+            else:
+                yield rows, np.linalg.eigvalsh(H_k)
+
+    def solve_mesh(self, nks, n_rows=None):
+        """Interpolated energies on the uniform mesh `nks`, evaluated in slabs with `iter_mesh`.
+
+        Returns:
+            eigvals (np.ndarray): Shape is nk_1 x nk_2 ... x n_wfs.
+        """
+        eigvals = np.empty((*nks, self.n_wfs))
+        for rows, eigvals_slab in self.iter_mesh(nks, n_rows=n_rows):
+            eigvals[rows] = eigvals_slab
+        return eigvals
+
+    def get_dos(self, nks, energies, method="tetrahedron", sigma=None, proj=False, n_rows=None):
+        """Density of states of the interpolated bands on the uniform mesh `nks`, see `DOS_accumulator`.
+
+        The eigenvalues (and eigenvectors) of each slab of `iter_mesh` are binned as they are 
+        computed, so only one slab is held at a time.
+
+        Args:
+            nks (list[int]): Number of k-points along each reciprocal lattice vector.
+            energies (np.ndarray): Uniformly spaced energies the DOS is evaluated at.
+            method (str): "tetrahedron" or "gaussian". Defaults to "tetrahedron".
+            sigma (float, optional): Width of the Gaussians for "gaussian".
+            proj (bool): Whether to also return the DOS projected onto each Wannier function.
+            n_rows (int, optional): Number of values of the first index per slab, see `iter_mesh`.
+
+        Returns:
+            dos (np.ndarray): Shape is n_energies.
+            pdos (np.ndarray): Shape is n_wfs x n_energies. Only if `proj`.
+        """
+        dos = DOS_accumulator(energies, method=method, sigma=sigma, n_proj=self.n_wfs if proj else None)
+        for rows, eigvals, *eigvecs in self.iter_mesh(nks, n_rows=n_rows, ret_eigvecs=proj):
+            # weight of Wannier function m in band n is |<w_m|psi_n>|^2, eigenvectors are columns
+            dos.add(eigvals, proj=np.swapaxes(abs(eigvecs[0]) ** 2, -1, -2) if proj else None)
+        return dos.get_dos()
+
+
 class Bloch():
-    def __init__(self, model: tb_model, *nks):
+    def __init__(
+            self, model: tb_model, *nks, hop_table: Hop_table | None = None, precision: str = "double",
+            n_threads: int = 1
+            ):
         """Class for storing and manipulating Bloch like wavefunctions.
         
         Wavefunctions are defined on a semi-full reciprocal space mesh.
+
+        Args:
+            hop_table (Hop_table | None):
+                Compiled hopping table of the model. If None, it is compiled from the model.
+            precision (str):
+                "double" (complex128) or "single" (complex64) working precision of the 
+                Hamiltonian, states and overlaps. Defaults to "double".
+            n_threads (int):
+                Number of threads the per-k kernels are split over. Defaults to 1.
         """
+        assert precision in _precision_dtypes, f"precision must be one of {list(_precision_dtypes)}"
         self.model: tb_model = model
         self.Lattice: Lattice = Lattice(model)
         self.K_mesh: K_mesh = K_mesh(model, *nks)
+        self.K_mesh.n_threads = n_threads
+        self.Hop_table: Hop_table = Hop_table(model) if hop_table is None else hop_table
+        self._precision: str = precision
+        self._dtype = _precision_dtypes[precision]
+        self.set_Bloch_ham()
+
+    def set_precision(self, precision: str):
+        """
+        Switches the working precision, recasting the Hamiltonian, states and overlaps.
+
+        The states are recast and orthonormalized (Lowdin), which keeps the subspace and the gauge
+        at each k-point. Energy eigenstates are not solved again, so after switching from single to
+        double precision they are accurate to single precision. Call `solve_model` to solve them again.
+
+        Args:
+            precision (str): "double" (complex128) or "single" (complex64)
+        """
+        assert precision in _precision_dtypes, f"precision must be one of {list(_precision_dtypes)}"
+        self._precision = precision
+        self._dtype = _precision_dtypes[precision]
         self.set_Bloch_ham()
 
-    def solve_model(self):
+        if hasattr(self, "_u_wfs"):
+            V, _, Wh = np.linalg.svd(self._u_wfs.astype(self._dtype), full_matrices=False)
+            self.set_wfs(V @ Wh, cell_periodic=True)
+        if hasattr(self, "energies"):
+            self.energies = self.energies.astype(np.finfo(self._dtype).dtype)
+
+    def solve_model(self, batched: bool = True):
         """
-        Solves for the eigenstates of the Bloch Hamiltonian defined by the model over a semi-full 
+        Solves for the eigenstates of the Bloch Hamiltonian defined by the model over a semi-full
         k-mesh, e.g. in 3D reduced coordinates {k = [kx, ky, kz] | k_i in [0, 1)}.
+
+        Args:
+            batched (bool):
+                If True, diagonalizes the stack of Bloch Hamiltonians `H_k` built by `set_Bloch_ham`
+                with a single call to `np.linalg.eigh`, giving the energies and cell-periodic states
+                in one pass. If False, solves the model one k-point at a time through pythtb.
+                Defaults to True.
         """
-        u_wfs = wf_array(self.model, [*self.K_mesh.nks])
-        energies = np.empty([*self.K_mesh.nks, self.Lattice._n_orb])
-        for k_idx in self.K_mesh.idx_arr:
-            energies[k_idx] = self.model.solve_one(self.K_mesh.full_mesh[k_idx], eig_vectors=False)
-            u_wfs.solve_on_one_point(self.K_mesh.full_mesh[k_idx], [*k_idx])
-        u_wfs = np.array(u_wfs._wfs, dtype=complex)
+        if batched:
+            # eigenvalues are returned in ascending order, eigenvectors as columns
+            energies, u_wfs = map_k_chunks(
+                np.linalg.eigh, self.H_k, dim_k=self.K_mesh.dim, n_threads=self.K_mesh.n_threads
+                )
+            u_wfs = np.swapaxes(u_wfs, -1, -2)  # [*nks, n, orb]
+        else:
+            u_wfs = wf_array(self.model, [*self.K_mesh.nks])
+            energies = np.empty([*self.K_mesh.nks, self.Lattice._n_orb])
+            for k_idx in self.K_mesh.idx_arr:
+                energies[k_idx] = self.model.solve_one(self.K_mesh.full_mesh[k_idx], eig_vectors=False)
+                u_wfs.solve_on_one_point(self.K_mesh.full_mesh[k_idx], [*k_idx])
+            u_wfs = np.array(u_wfs._wfs, dtype=self._dtype)
         self.set_wfs(u_wfs)
         self.energies = energies
 
@@ -317,22 +1083,72 @@ class Bloch():
         return {"Bloch": self._psi_wfs, "Cell periodic": self._u_wfs}
     
     def get_projector(self, return_Q = False):
-        assert hasattr(self, "_P"), "Need to call `solve_model` or `set_wfs` to initialize Bloch states"
+        """Returns the band projector P_k = sum_n |u_{n,k}><u_{n,k}| (and Q_k = 1 - P_k).
+
+        The projector has rank n_states, so it is kept in the factored form U U^dagger through
+        the cell-periodic states and only densified into an n_orb x n_orb array on request.
+        """
+        assert hasattr(self, "_u_wfs"), "Need to call `solve_model` or `set_wfs` to initialize Bloch states"
+        P = np.einsum("...ni, ...nj -> ...ij", self._u_wfs, self._u_wfs.conj())
         if return_Q:
-            return self._P, self._Q
+            Q = np.eye(P.shape[-1]) - P
+            return P, Q
         else:
-            return self._P
+            return P
     
     def get_nbr_projector(self, return_Q = False):
-        assert hasattr(self, "_P_nbr"), "Need to call `solve_model` or `set_wfs` to initialize Bloch states"
+        """Returns the band projectors P_{k+b} at the neighbors of each k-point (and Q_{k+b} = 1 - P_{k+b}).
+
+        Like `get_projector`, the dense arrays of shape [*nks, num_nnbrs, n_orb, n_orb] are only
+        built on request from the states.
+        """
+        assert hasattr(self, "_u_wfs"), "Need to call `solve_model` or `set_wfs` to initialize Bloch states"
+        nks = self.K_mesh.nks
+        n_orb = self.Lattice._n_orb
+        num_nnbrs = self.K_mesh.num_nnbrs
+
+        P_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=self._u_wfs.dtype)
+        states_pbc = np.empty(self._u_wfs.shape, dtype=self._u_wfs.dtype)  # reused for each neighbor
+        for idx in range(num_nnbrs):  # nearest neighbors
+            # accounting for phase across the BZ boundary
+            self.K_mesh.get_nbr_states(self._u_wfs, idx, out=states_pbc)
+            map_k_chunks(
+                _outer_states, states_pbc, dim_k=self.K_mesh.dim, n_threads=self.K_mesh.n_threads,
+                out=P_nbr[..., idx, :, :]
+                )
+
         if return_Q:
-            return self._P_nbr, self._Q_nbr
+            Q_nbr = np.eye(n_orb) - P_nbr
+            return P_nbr, Q_nbr
         else:
-            return self._P_nbr
+            return P_nbr
 
     def get_energies(self):
         assert hasattr(self, "energies"), "Need to call `solve_model` to initialize energies"
         return self.energies
+
+    def get_dos(self, energies, method="tetrahedron", sigma=None, proj=False):
+        """Density of states of the energies from `solve_model`, see `DOS_accumulator`.
+
+        Args:
+            energies (np.ndarray): Uniformly spaced energies the DOS is evaluated at.
+            method (str): "tetrahedron" or "gaussian". Defaults to "tetrahedron".
+            sigma (float, optional): Width of the Gaussians for "gaussian".
+            proj (bool): Whether to also return the DOS projected onto each orbital.
+
+        Returns:
+            dos (np.ndarray): Shape is n_energies.
+            pdos (np.ndarray): Shape is n_orb x n_energies. Only if `proj`.
+        """
+        assert hasattr(self, "energies"), "Need to call `solve_model` to initialize energies"
+        n_orb = self.Lattice._n_orb
+        dos = DOS_accumulator(energies, method=method, sigma=sigma, n_proj=n_orb if proj else None)
+        # rows of the mesh added in slabs, bounding the work arrays of the binning
+        n_rows = max(1, 4096 // int(np.prod(self.K_mesh.nks[1:])))
+        for lo in range(0, self.K_mesh.nks[0], n_rows):
+            rows = slice(lo, lo + n_rows)
+            dos.add(self.energies[rows], proj=abs(self._u_wfs[rows]) ** 2 if proj else None)
+        return dos.get_dos()
     
     def get_Bloch_Ham(self):
         """Returns the Bloch Hamiltonian of the model defined over the semi-full k-mesh."""
@@ -347,13 +1163,8 @@ class Bloch():
         return self._M
     
     def set_Bloch_ham(self):
-        H_k = np.zeros((*self.K_mesh.nks, self.Lattice._n_orb, self.Lattice._n_orb), dtype=complex)
-
-        for k_idx in self.K_mesh.idx_arr:
-            k_pt = self.K_mesh.full_mesh[k_idx]
-            H_k[k_idx] = self.model._gen_ham(k_pt)
-
-        self.H_k = H_k
+        """Assembles the Bloch Hamiltonian over the full k-mesh from the compiled hopping table."""
+        self.H_k = self.Hop_table.gen_ham(self.K_mesh.full_mesh).astype(self._dtype, copy=False)
 
     def set_wfs(self, wfs, cell_periodic: bool=True):
         """
@@ -364,7 +1175,9 @@ class Bloch():
                 Bloch (or cell-periodic) eigenstates defined on a semi-full k-mesh corresponding
                 to nks passed during class instantiation. The mesh is assumed to exlude the
                 endpoints, e.g. in reduced coordinates {k = [kx, ky, kz] | k_i in [0, 1)}. 
+                States are cast to the working precision.
         """
+        wfs = np.asarray(wfs, dtype=self._dtype)
         if cell_periodic:
             self._u_wfs = wfs
             self._psi_wfs = self.apply_phase(wfs)
@@ -374,27 +1187,34 @@ class Bloch():
 
         self._n_states = self._u_wfs.shape[-2]
         self._M = self.self_overlap_mat()
+        # band projectors are not stored, `get_projector` and `get_nbr_projector` build them from the states
+
+    def rotate_gauge(self, U, M=None):
+        """
+        Applies a k-dependent unitary to the states, |u'_{n,k}> = sum_m U_{m,n,k} |u_{m,k}>.
+
+        Since only the gauge changes, the overlap matrix is rotated directly as
+        M'_{k,b} = U_k^dagger M_{k,b} U_{k+b} instead of being recomputed from the states.
+        The band projectors are gauge invariant and need no update.
+
+        Args:
+            U (np.ndarray): 
+                Unitary gauge transformation. Shape is [*nks, n_states, n_states].
+            M (np.ndarray, optional): 
+                Overlap matrix in the new gauge if it is already known, e.g. from a gauge
+                optimization. Defaults to rotating the stored overlap matrix.
+        """
+        assert hasattr(self, "_u_wfs"), "Need to call `solve_model` or `set_wfs` to initialize Bloch states"
+        U_T = np.swapaxes(U, -1, -2).astype(self._dtype, copy=False)
+        if M is None:
+            U_nbr = self.K_mesh.get_nbr_gauge(U)
+            M = U_T.conj()[..., np.newaxis, :, :] @ self._M @ U_nbr.astype(self._dtype, copy=False)
+
+        # phase exp(i k . tau) acts on orbitals and commutes with the rotation
+        self._u_wfs = U_T @ self._u_wfs
+        self._psi_wfs = U_T @ self._psi_wfs
+        self._M = M.astype(self._dtype, copy=False)
 
-        nks = self.K_mesh.nks
-        n_orb = self.Lattice._n_orb
-        num_nnbrs = self.K_mesh.num_nnbrs
-        nnbr_idx_shell = self.K_mesh.nnbr_idx_shell
- 
-        # band projector
-        self._P = np.einsum("...ni, ...nj -> ...ij", self._u_wfs, self._u_wfs.conj())
-        self._Q = np.eye(self._P.shape[-1]) - self._P[..., :, :]
-
-        # Projectors of initial tilde subspace at points neighboring each k-point
-        self._P_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-        self._Q_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-        for idx, idx_vec in enumerate(nnbr_idx_shell[0]):  # nearest neighbors
-            # accounting for phase across the BZ boundary
-            states_pbc = np.roll(self._u_wfs, shift=tuple(-idx_vec), axis=(0,1)) * self.K_mesh.bc_phase[..., idx, np.newaxis,  :]
-            self._P_nbr[..., idx, :, :] = np.einsum(
-                    "...ni, ...nj -> ...ij", states_pbc, states_pbc.conj()
-                    )
-            self._Q_nbr[..., idx, :, :] = np.eye(n_orb) - self._P_nbr[..., idx, :, :]
-                
     def apply_phase(self, wfs, inverse=False):
         """
         Change between cell periodic and Bloch wfs by multiplying exp(\pm i k . tau)
@@ -408,6 +1228,7 @@ class Bloch():
 
         """
         phases = self.K_mesh.get_orb_phases(inverse=inverse).reshape(*self.K_mesh.nks, self.Lattice._n_orb)
+        phases = phases.astype(np.result_type(wfs, np.complex64), copy=False)
     
         # Broadcasting the phases to match dimensions
         wfsxphase = wfs * phases[..., np.newaxis, :] 
@@ -426,18 +1247,7 @@ class Bloch():
         """
 
         # Assumes only one shell for now
-        _, idx_shell = self.K_mesh.get_k_shell(N_sh=1, report=False)
-        bc_phase = self.K_mesh.bc_phase
-
-        M = np.zeros(
-            (*self.K_mesh.nks, len(idx_shell[0]), self._n_states, self._n_states), dtype=complex
-        )  # overlap matrix
-        
-        for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-            # introduce phases to states when k+b is across the BZ boundary
-            states_pbc = np.roll(self._u_wfs, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
-            M[..., idx, :, :] = np.einsum("...mj, ...nj -> ...mn", self._u_wfs.conj(), states_pbc)
-        return M
+        return self.K_mesh.get_overlap_mat(self._u_wfs)
     
     def tf_overlap_mat(self, psi_wfs, tfs, state_idx):
         """
@@ -533,19 +1343,127 @@ class Bloch():
         return fig, ax
         
 
+# Gauge problem of a multi-start worker process, set once per process by `_init_multistart_worker`
+_multistart_problem = None
+
+
+def _init_multistart_worker(M, k_mesh, nks, n_threads):
+    """
+    Receives only the overlaps of the tilde states and the mesh, not the whole Wannier object.
+    The minimization runs on a bare Wannier object holding the mesh, see `Wannier._min_unitary`.
+    """
+    global _multistart_problem
+    wannier = Wannier.__new__(Wannier)
+    wannier.K_mesh, wannier._nks, wannier.n_threads = k_mesh, nks, n_threads
+    _multistart_problem = (wannier, M)
+
+
+def _multistart_worker(U_init, min_kwargs, return_M=False):
+    """
+    Runs the gauge minimization from the gauge U_init and returns (Omega_tilde, U), 
+    and the rotated overlaps if return_M.
+    """
+    wannier, M = _multistart_problem
+    U, M_rot = wannier._min_unitary(M, U_init=U_init, **min_kwargs)
+    w_b, k_shell, _ = wannier.K_mesh.get_weights()
+    omega_til = wannier._get_Omega_til(M_rot, w_b[0], k_shell[0]).real
+    return (omega_til, U, M_rot) if return_M else (omega_til, U)
+
+
+class Gauge_workspace():
+    def __init__(self, nks, num_nnbrs: int, n_wfs: int, dtype=complex):
+        """
+        Preallocated arrays for the iterations of `Wannier.find_min_unitary`.
+
+        Sized once from the mesh, the number of neighbors and the number of Wannier functions, so 
+        the gauge updates, overlap rotations and the Omega_tilde kernel run in place.
+
+        Args:
+            nks (list): number of k-points along each direction
+            num_nnbrs (int): number of nearest neighbor k-points
+            n_wfs (int): number of Wannier functions
+            dtype: complex dtype of the working precision
+        """
+        self.shape = (tuple(nks), num_nnbrs, n_wfs, np.dtype(dtype))
+        mat = (*nks, n_wfs, n_wfs)
+        ovlp = (*nks, num_nnbrs, n_wfs, n_wfs)
+
+        # gauge, its update and conjugate transpose
+        self.U = np.empty(mat, dtype=dtype)
+        self.U_new = np.empty(mat, dtype=dtype)
+        self.U_dag = np.empty(mat, dtype=dtype)
+        self.dU = np.empty(mat, dtype=dtype)
+        # descent direction, its conjugate transpose and the step
+        self.G = np.empty(mat, dtype=dtype)
+        self.G_dag = np.empty(mat, dtype=dtype)
+        self.D = np.empty(mat, dtype=dtype)
+        # overlaps: initial, rotated, U_{k+b} and U_k^dag M0_{k,b}
+        self.M0 = np.empty(ovlp, dtype=dtype)
+        self.M = np.empty(ovlp, dtype=dtype)
+        self.U_nbr = np.empty(ovlp, dtype=dtype)
+        self.UM0 = np.empty(ovlp, dtype=dtype)
+        # diagonal quantities of the Omega_tilde kernel
+        self.log_diag = np.empty((*nks, num_nnbrs, n_wfs), dtype=dtype)
+        self.q = np.empty((*nks, num_nnbrs, n_wfs), dtype=np.finfo(dtype).dtype)
+        self.coeff = np.empty((*nks, num_nnbrs, n_wfs), dtype=dtype)
+        self.diag_conj = np.empty((*nks, num_nnbrs, n_wfs), dtype=dtype)
+
+    def fits(self, nks, num_nnbrs: int, n_wfs: int, dtype) -> bool:
+        """Whether the workspace can be reused for these dimensions."""
+        return self.shape == (tuple(nks), num_nnbrs, n_wfs, np.dtype(dtype))
+
+
 class Wannier():
     def __init__(
-            self, model: tb_model, nks: list  
+            self, model: tb_model, nks: list, precision: str = "double", n_threads: int = 1
             ):
+        """
+        Args:
+            precision (str):
+                "double" (complex128) or "single" (complex64) working precision of the states,
+                overlaps, projectors and unitary iterations. Defaults to "double".
+            n_threads (int):
+                Experimental. Number of threads the per-k kernels (overlaps, projectors, diagonalizations 
+                and matrix exponentials) are split over, see `map_k_chunks`. More threads can only help on 
+                a multi-core machine whose BLAS runs single threaded, and this has not been measured yet. 
+                On a single core they are slower. Defaults to 1.
+        """
         self._model: tb_model = model
         self._nks: list = nks
+        self._precision: str = precision
+        self.n_threads: int = n_threads
 
         self.Lattice: Lattice = Lattice(model)
         self.K_mesh: K_mesh = K_mesh(model, *nks)
+        self.K_mesh.n_threads = n_threads
+
+        # hoppings are compiled once and shared by both sets of states
+        self.Hop_table: Hop_table = Hop_table(model)
 
-        self.energy_eigstates: Bloch = Bloch(model, *nks)
+        self.energy_eigstates: Bloch = Bloch(
+            model, *nks, hop_table=self.Hop_table, precision=precision, n_threads=n_threads)
         self.energy_eigstates.solve_model()
-        self.tilde_states: Bloch = Bloch(model, *nks)
+        self.tilde_states: Bloch = Bloch(
+            model, *nks, hop_table=self.Hop_table, precision=precision, n_threads=n_threads)
+
+        # real space Hamiltonians of the tilde states, see `get_H_R`
+        self._H_R_cache: dict = {}
+
+    def set_precision(self, precision: str, update_spread: bool = True):
+        """
+        Switches the working precision of the energy eigenstates and tilde states.
+
+        Args:
+            precision (str): "double" (complex128) or "single" (complex64)
+            update_spread (bool): 
+                If False, the spreads and centers keep the values computed in the previous precision,
+                which `spread_precision` records. Defaults to True.
+        """
+        self._precision = precision
+        self.energy_eigstates.set_precision(precision)
+        self.tilde_states.set_precision(precision)
+        if update_spread and hasattr(self, "spread"):
+            self._set_spread()
 
     def get_tilde_states(self):
         return self.tilde_states.get_states()
@@ -617,6 +1535,24 @@ class Wannier():
     
     def set_tilde_states(self, tilde_states, cell_periodic=False):
         self.tilde_states.set_wfs(tilde_states, cell_periodic=cell_periodic)
+        self._set_spread()
+
+    def set_tilde_gauge(self, U, M=None):
+        """
+        Rotates the tilde states by the unitary U without recomputing their overlaps from scratch.
+
+        Args:
+            U (np.ndarray): Unitary gauge transformation [*nks, n_states, n_states].
+            M (np.ndarray, optional): Overlap matrix in the new gauge, if already known.
+        """
+        self.tilde_states.rotate_gauge(U, M=M)
+        self._set_spread()
+
+    def _set_spread(self):
+        # called whenever the tilde states change, which invalidates their real space Hamiltonian
+        self._H_R_cache = {}
+        # spread and centers only depend on the overlap matrix of the tilde states
+        self.spread_precision = self.tilde_states._precision
         spread = self.spread_recip(decomp=True)
         self.spread = spread[0][0]
         self.omega_i = spread[0][1]
@@ -688,11 +1624,7 @@ class Wannier():
         # DFT
         self.WFs = np.fft.ifftn(psi_wfs, axes=[i for i in range(dim_k)], norm=None)
 
-        spread = self.spread_recip(decomp=True)
-        self.spread = spread[0][0]
-        self.omega_i = spread[0][1]
-        self.omega_til = spread[0][2]
-        self.centers = spread[1]
+        self._set_spread()
 
     
     # TODO: Allow for arbitrary dimensions and optimize
@@ -811,22 +1743,72 @@ class Wannier():
             return spread_n, r_n, rsq_n
         
 
-    def _get_Omega_til(self, M, w_b, k_shell):
+    def _get_Omega_til(self, M, w_b, k_shell, abs_M_sq=None):
+        return self._get_Omega_til_grad(M, w_b, k_shell, abs_M_sq=abs_M_sq, grad=False)[0]
+
+    def _get_Omega_til_grad(self, M, w_b, k_shell, abs_M_sq=None, grad=True, out=None, ws=None):
+        """
+        Omega_tilde, the centers and the steepest descent direction G from one pass over M.
+
+        The gradient 4 w_b sum_b (A[R] - S[T]) is assembled as 2 w_b (Y - Y^dagger) with
+        Y_mn = sum_b M_mn (M_nn^* + i q_n / M_nn), so R, T and their symmetrizations are never formed.
+
+        Args:
+            M (np.ndarray): overlap matrix [*nks, b, n, n]
+            w_b (float): finite difference weight of the shell
+            k_shell (np.ndarray): vectors b of the shell
+            abs_M_sq (float, optional): 
+                sum |M|^2. It is gauge invariant, so it can be computed once per minimization.
+                Otherwise the off-diagonal part of |M|^2 is summed from M, see below.
+            grad (bool): whether to compute G. Defaults to True.
+            out (np.ndarray, optional): buffer [*nks, n, n] that G is written into
+            ws (Gauge_workspace, optional): buffers for the intermediates, nothing is allocated 
+                beyond a few small arrays when given
+
+        Returns:
+            Omega_tilde, r_n, G: spread, centers [n, dim] and descent direction (None if `grad` is False)
+
+        The reductions are accumulated in double precision. sum |M|^2 and sum |M_nn|^2 are both of
+        order Nk * b * n while Omega_tilde is small, so in single precision their difference would
+        lose most digits. Without `abs_M_sq`, the same rounded |M_mn|^2 enter both sums and the 
+        diagonal cancels to double precision.
+        """
         nks = M.shape[:-3]
         Nk = np.prod(nks)
         k_axes = tuple([i for i in range(len(nks))])
 
         diag_M = np.diagonal(M, axis1=-1, axis2=-2)
-        log_diag_M_imag = np.log(diag_M).imag
-        abs_diag_M_sq = abs(diag_M) ** 2
+        log_diag_M_imag = np.log(diag_M, out=None if ws is None else ws.log_diag).imag
 
-        r_n = -(1 / Nk) * w_b * np.sum(log_diag_M_imag, axis=k_axes).T @ k_shell
+        r_n = -(1 / Nk) * w_b * np.sum(log_diag_M_imag, axis=k_axes, dtype=np.float64).T @ k_shell
+        q = np.add(log_diag_M_imag, k_shell @ r_n.T, out=None if ws is None else ws.q)
+        q_sq = np.vdot(*[q.astype(np.float64, copy=False)] * 2)
 
-        Omega_tilde = (1 / Nk) * w_b * ( 
-                np.sum((-log_diag_M_imag - k_shell @ r_n.T)**2) + 
-                np.sum(abs(M)**2) - np.sum(abs_diag_M_sq)
-            )
-        return Omega_tilde
+        if abs_M_sq is None:
+            abs_M = abs(M) ** 2
+            off_diag_sq = (
+                np.sum(abs_M, dtype=np.float64) 
+                - np.sum(np.diagonal(abs_M, axis1=-1, axis2=-2), dtype=np.float64)
+                )
+        else:
+            off_diag_sq = abs_M_sq - np.sum(abs(diag_M) ** 2, dtype=np.float64)
+        Omega_tilde = (1 / Nk) * w_b * (q_sq + off_diag_sq)
+
+        if not grad:
+            return Omega_tilde, r_n, None
+
+        if ws is None:
+            coeff = (diag_M.conj() + 1j * q / diag_M).astype(M.dtype, copy=False)
+            Y = np.einsum("...bmn, ...bn -> ...mn", M, coeff, out=out)
+            G = np.subtract(Y, np.swapaxes(Y, -1, -2).conj(), out=Y)
+        else:
+            coeff = np.divide(q, diag_M, out=ws.coeff)
+            coeff *= 1j
+            coeff += np.conjugate(diag_M, out=ws.diag_conj)
+            Y = np.einsum("...bmn, ...bn -> ...mn", M, coeff, out=ws.G if out is None else out)
+            G = np.subtract(Y, np.conjugate(np.swapaxes(Y, -1, -2), out=ws.G_dag), out=Y)
+        G *= 2 * w_b
+        return Omega_tilde, r_n, G
 
 
     def _get_Omega_I(self, M, w_b, k_shell):
@@ -836,21 +1818,28 @@ class Wannier():
         return Omega_i
     
     
-    def get_Omega_I(self):
-        P = self.tilde_states.get_projector()
-        P_nbr, Q_nbr = self.tilde_states.get_nbr_projector(return_Q=True)
-        nks = self.K_mesh.nks
-        Nk = np.prod(nks)
-        num_nnbrs = self.K_mesh.num_nnbrs
-        w_b, _, idx_shell = self.K_mesh.get_weights(N_sh=1)
+    def _get_omega_I_k(self, M, w_b, n_states=None):
+        """
+        Contribution of each k-point to Omega_I computed from the overlap matrices.
 
-        T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
-        for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-            T_kb[..., idx] = np.trace(P[..., :, :] @ Q_nbr[..., idx, :, :], axis1=-1, axis2=-2)
+        Uses tr(P_k Q_{k+b}) = n - ||M_{k,b}||_F^2, so only the n x n overlaps are needed
+        instead of products of n_orb x n_orb projectors.
 
-        return (1 / Nk) * w_b[0] * np.sum(T_kb)
+        Args:
+            M (np.ndarray): overlap matrix [*nks, b, n, n]
+            w_b (float): finite difference weight of the shell
+            n_states (int | np.ndarray, optional): number of states at each k-point [*nks] when 
+                the overlaps are zero padded. Defaults to n.
+        """
+        Nk = np.prod(M.shape[:-3])
+        if n_states is None:
+            n_states = M.shape[-2]
+        T_kb = np.asarray(n_states)[..., np.newaxis] - np.sum(abs(M) ** 2, axis=(-1, -2))  # [*nks, b]
+        return (1 / Nk) * w_b * np.sum(T_kb, axis=-1)
     
-    def get_omega_I_k(self):
+
+    def _get_omega_I_k_proj(self):
+        """Projector form of `_get_omega_I_k`, (1/Nk) sum_b w_b tr(P_k Q_{k+b}). Kept as a reference."""
         P = self.tilde_states.get_projector()
         P_nbr, Q_nbr = self.tilde_states.get_nbr_projector(return_Q=True)
         nks = self.K_mesh.nks
@@ -863,16 +1852,57 @@ class Wannier():
             T_kb[..., idx] = np.trace(P[..., :, :] @ Q_nbr[..., idx, :, :], axis1=-1, axis2=-2)
 
         return (1 / Nk) * w_b[0] * np.sum(T_kb, axis=-1)
+
+
+    def get_Omega_I(self, use_projectors=False):
+        """Gauge invariant part of the spread of the tilde states.
+
+        Args:
+            use_projectors (bool):
+                If True, evaluates tr(P_k Q_{k+b}) with dense n_orb x n_orb projectors
+                instead of the overlap matrices. Defaults to False.
+        """
+        return np.sum(self.get_omega_I_k(use_projectors=use_projectors))
+    
+    def get_omega_I_k(self, use_projectors=False):
+        """Contribution of each k-point to the gauge invariant spread of the tilde states.
+
+        Args:
+            use_projectors (bool):
+                If True, evaluates tr(P_k Q_{k+b}) with dense n_orb x n_orb projectors
+                instead of the overlap matrices. Defaults to False.
+        """
+        if use_projectors:
+            return self._get_omega_I_k_proj()
+
+        w_b, _, _ = self.K_mesh.get_weights(N_sh=1)
+        return self._get_omega_I_k(self.tilde_states._M, w_b[0])
     
      ####### Maximally Localized WF ############
 
     def find_optimal_subspace(
         self, N_wfs=None, inner_window=None, outer_window="occupied", 
-        iter_num=100, verbose=False, tol=1e-10, alpha=1
+        iter_num=100, verbose=False, tol=1e-10, alpha=1, mixing="linear", mix_history=5, eig_solver="eigh"
     ):
-        # useful constants
-        nks = self._nks 
-        Nk = np.prod(nks)
+        """Finds the subspaces throughout the BZ that minimizes the gauge-independent spread.
+
+        The windows are given by band indices, {"bands": [...]}, or by energies, {"energy": [E_min, E_max]}.
+        If both windows are given by bands, this defers to `find_optimal_subspace_bands`. Energy windows 
+        contain a different number of states at each k-point. The states of each window are then stored 
+        padded to the largest count, together with a mask of the valid entries, so that all k-points are 
+        handled by the same batched operations as the band windows.
+
+        Args:
+            N_wfs (int): Dimension of the subspace. Defaults to the number of tilde states.
+            inner_window (dict | None): Frozen states, kept in the subspace at every k-point. Must lie
+                inside the outer window. Defaults to None.
+            outer_window (dict | str): States the subspace is chosen from. If "occupied", uses the 
+                lower half of the bands. Defaults to "occupied".
+            eig_solver (str): "eigh" or "subspace", see `find_optimal_subspace_bands`. "subspace" is only used
+                when 2 (N_wfs - N_inner) is less than the largest number of outer window states outside of 
+                the inner window. Otherwise a warning is raised and the full `eigh` is used.
+            iter_num, verbose, tol, alpha, mixing, mix_history: See `find_optimal_subspace_bands`.
+        """
         n_orb = self.Lattice._n_orb
         n_occ = int(n_orb/2)
 
@@ -880,283 +1910,101 @@ class Wannier():
         energies = self.energy_eigstates.get_energies()
         unk_states = self.energy_eigstates.get_states()["Cell periodic"]
 
-        # initial subspace
-        init_states = self.tilde_states
-      
-        #### Setting inner/outer energy windows ####
-
         # number of states in target manifold 
         if N_wfs is None:
-            N_wfs = init_states._n_states
+            N_wfs = self.tilde_states._n_states
 
         # outer window
         if outer_window == "occupied":
-            outer_window_type = "bands" # optimally would like to use band indices
-
-            # used in case inner window is defined by energy values
+            outer_window_type = "bands"
             outer_band_idxs = list(range(n_occ))
-            outer_band_energies = energies[..., outer_band_idxs]
-            outer_energies = [np.argmin(outer_band_energies), np.argmax(outer_band_energies)]
-
-            # mask out states outside outer window
-            nan = np.empty(unk_states.shape)
-            nan.fill(np.NaN)
-            states_sliced = np.where(
-                np.logical_and(
-                    energies[..., np.newaxis] >= outer_energies[0], 
-                    energies[..., np.newaxis] <= outer_energies[1]
-                    ), 
-                    unk_states, nan)
-            mask_outer = np.isnan(states_sliced)
-            masked_outer_states = np.ma.masked_array(states_sliced, mask=mask_outer)
-
         elif list(outer_window.keys())[0].lower() == 'bands':
             outer_window_type = "bands"
-
-            # used in case inner window is defined by energy values
             outer_band_idxs = list(outer_window.values())[0]
-            outer_band_energies = energies[..., outer_band_idxs]
-            outer_energies = [np.argmin(outer_band_energies), np.argmax(outer_band_energies)]
-
-            # mask out states outside outer window
-            nan = np.empty(unk_states.shape)
-            nan.fill(np.NaN)
-            states_sliced = np.where(
-                np.logical_and(
-                    energies[..., np.newaxis] >= outer_energies[0], 
-                    energies[..., np.newaxis] <= outer_energies[1]
-                    ), 
-                    unk_states, nan)
-            mask_outer = np.isnan(states_sliced)
-            masked_outer_states = np.ma.masked_array(states_sliced, mask=mask_outer)
-
         elif list(outer_window.keys())[0].lower() == 'energy':
             outer_window_type = "energy"
-
-            # energy window
             outer_energies = np.sort(list(outer_window.values())[0])
 
-            # mask out states outside outer window
-            nan = np.empty(unk_states.shape)
-            nan.fill(np.NaN)
-            states_sliced = np.where(
-                np.logical_and(
-                    energies[..., np.newaxis] >= outer_energies[0], 
-                    energies[..., np.newaxis] <= outer_energies[1]
-                    ), 
-                    unk_states, nan)
-            mask_outer = np.isnan(states_sliced)
-            masked_outer_states = np.ma.masked_array(states_sliced, mask=mask_outer)
-            
         # inner window
         if inner_window is None:
-            N_inner = 0
             inner_window_type = outer_window_type
             inner_band_idxs = None
-
         elif list(inner_window.keys())[0].lower() == 'bands':
             inner_window_type = "bands"
-
             inner_band_idxs = list(inner_window.values())[0]
-            inner_band_energies = energies[..., inner_band_idxs]
-            inner_energies = [np.argmin(inner_band_energies), np.argmax(inner_band_energies)]
-
-            # used in case outer window is energy dependent
-            nan = np.empty(unk_states.shape)
-            nan.fill(np.NaN)
-            states_sliced = np.where(
-                np.logical_and(
-                    energies[..., np.newaxis] >= inner_energies[0], 
-                    energies[..., np.newaxis] <= inner_energies[1]), 
-                    unk_states, nan
-                    )
-            mask_inner = np.isnan(states_sliced)
-            masked_inner_states = np.ma.masked_array(states_sliced, mask=mask_inner)
-            inner_states = masked_inner_states
-
         elif list(inner_window.keys())[0].lower() == 'energy':
             inner_window_type = "energy"
-
-            inner_energies =  np.sort(list(inner_window.values())[0])
-
-            nan = np.empty(unk_states.shape)
-            nan.fill(np.NaN)
-            states_sliced = np.where(
-                np.logical_and(
-                    energies[..., np.newaxis] >= inner_energies[0], 
-                    energies[..., np.newaxis] <= inner_energies[1]), 
-                    unk_states, nan
-                    )
-            mask_inner = np.isnan(states_sliced)
-            masked_inner_states = np.ma.masked_array(states_sliced, mask=mask_inner)
-            inner_states = masked_inner_states
-            N_inner = (~inner_states.mask).sum(axis=(-1,-2))//n_orb
+            inner_energies = np.sort(list(inner_window.values())[0])
 
         if inner_window_type == "bands" and outer_window_type == "bands":
             # defer to the faster function
             return self.find_optimal_subspace_bands(
                 N_wfs=N_wfs, inner_bands=inner_band_idxs, outer_bands=outer_band_idxs, 
-                iter_num=iter_num, verbose=verbose, tol=tol, alpha=alpha)
-
-        # minimization manifold
-        if inner_window is not None:
-            # states in outer manifold and outside inner manifold
-            min_mask = ~np.logical_and(~mask_outer, mask_inner)
-            min_states = np.ma.masked_array(unk_states, mask=min_mask)
-            min_states = np.ma.filled(min_states, fill_value=0)
-        else:
-            min_states = masked_outer_states
-            min_states = np.ma.filled(min_states, fill_value=0)
-        
-        # number of states to keep in minimization subspace
-        if inner_window is None:
-            # keep all the states from minimization manifold
-            num_keep = np.full(min_states.shape, N_wfs)
-            keep_mask = (np.arange(min_states.shape[-2]) >= num_keep)
-            keep_mask = np.swapaxes(keep_mask, axis1=-1, axis2=-2)
-        else: # n_inner is k-dependent when using energy window
-            N_inner = (~inner_states.mask).sum(axis=(-1,-2))//n_orb
-            num_keep = N_wfs - N_inner # matrix of integers
-            keep_mask = (np.arange(min_states.shape[-2]) >= (num_keep[:, :, np.newaxis, np.newaxis]))
-            keep_mask = keep_mask.repeat(min_states.shape[-2], axis=-2)
-            keep_mask = np.swapaxes(keep_mask, axis1=-1, axis2=-2)
-
-        N_min = (~min_states.mask).sum(axis=(-1,-2))//n_orb
-        N_outer = (~masked_outer_states.mask).sum(axis=(-1,-2))//n_orb
-        print(N_inner)
-        print(N_min)
-        print(N_outer)
-        print(keep_mask[0,0])
-        print(min_states[0,0].round(5))
-        # exit()
-
-        # Assumes only one shell for now
-        w_b, _, idx_shell = self.K_mesh.get_weights(N_sh=1)
-        num_nnbrs = self.K_mesh.num_nnbrs
-        bc_phase = self.K_mesh.bc_phase
-        
-        # Projector of initial tilde subspace at each k-point
-        P = init_states.get_projector()
-        P_nbr, Q_nbr = init_states.get_nbr_projector(return_Q=True)
-        T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
-        for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-            T_kb[..., idx] = np.trace(P[..., :, :] @ Q_nbr[..., idx, :, :], axis1=-1, axis2=-2)
-        P_min = np.copy(P)  # for start of iteration
-        P_nbr_min = np.copy(P_nbr)  # for start of iteration
-        Q_nbr_min = np.copy(Q_nbr)  # for start of iteration
-
-        omega_I_prev = (1 / Nk) * w_b[0] * np.sum(T_kb)
+                iter_num=iter_num, verbose=verbose, tol=tol, alpha=alpha, mixing=mixing, mix_history=mix_history,
+                eig_solver=eig_solver)
 
-        #### Start of minimization iteration ####
-        for i in range(iter_num):
-            P_avg = np.sum(w_b[0] * P_nbr_min, axis=-3)
-            Z = min_states.conj() @ P_avg @ np.transpose(min_states, axes=(0,1,3,2))
-            # masked entries correspond to subspace spanned by states outside min manifold
-            Z = np.ma.filled(Z, fill_value=0)
-            # print("P_Avg[0,0]: ", P_avg[0,0].round(5))
-            # print("Z[0,0]: ", Z[0,0].round(5))
-
-            eigvals, eigvecs = np.linalg.eigh(Z) # [..., val, idx]
-            eigvecs = np.swapaxes(eigvecs, axis1=-1, axis2=-2) # [..., idx, val]
-            # print(eigvals[0,0])
-            # print(eigvecs[0,0].round(5))
-
-            # eigvals = 0 correspond to states outside the minimization manifold. Mask these out.
-            zero_mask = eigvals.round(10) == 0
-            non_zero_eigvals = np.ma.masked_array(eigvals, mask=zero_mask)
-            non_zero_eigvecs = np.ma.masked_array(eigvecs, mask=np.repeat(zero_mask[..., np.newaxis], repeats=eigvals.shape[-1], axis=-1))
-
-            # sort eigvals and eigvecs by eigenvalues in descending order excluding eigvals=0
-            sorted_eigvals_idxs = np.argsort(-non_zero_eigvals, axis=-1)
-            sorted_eigvals = np.take_along_axis(non_zero_eigvals, sorted_eigvals_idxs, axis=-1)
-            sorted_eigvecs = np.take_along_axis(non_zero_eigvecs, sorted_eigvals_idxs[..., np.newaxis], axis=-2)
-            sorted_eigvecs = np.ma.filled(sorted_eigvecs, fill_value=0)
-            # print(eigvals[0,0])
-            # print("sorted eigenvalues[0,0]: ", sorted_eigvals[0,0])
-            # print("sorted eigenvectors[0,0]: ", sorted_eigvecs[0,0].round(5))
-
-            states_min = np.einsum('...ji, ...ik->...jk', sorted_eigvecs, min_states)
-            # states_min = sorted_eigvecs @ min_states
-            keep_states = np.ma.masked_array(states_min, mask=keep_mask)
-
-            # min_keep = np.ma.masked_array(keep_states, mask=keep_mask)
-            # subspace = np.ma.concatenate((min_keep, inner_states), axis=-2)
-            # subspace_sliced = subspace[np.where(~subspace.mask)]
-            # subspace_sliced = subspace_sliced.reshape((*nks, N_wfs, n_orb))
-            # subspace_sliced = np.array(subspace_sliced)
-
-            keep_states = np.ma.filled(keep_states, fill_value=0)
-
-            # print("states_min[0,0]: ", states_min[0,0].round(5))
-            # print("Keep_states[0,0]: ", keep_states[0,0].round(5))
-            # exit()
-
-            P_new = np.einsum("...ni,...nj->...ij", keep_states, keep_states.conj())
-            P_min = alpha * P_new + (1 - alpha) * P_min # for next iteration
-            for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-                states_pbc = np.roll(keep_states, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
-                P_nbr_min[..., idx, :, :] = np.einsum(
-                        "...ni, ...nj->...ij", states_pbc, states_pbc.conj()
-                        )
-                Q_nbr_min[..., idx, :, :] = np.eye(n_orb) - P_nbr_min[..., idx, :, :]
-                T_kb[..., idx] = np.trace(P_min[..., :, :] @ Q_nbr_min[..., idx, :, :], axis1=-1, axis2=-2)
-            
-            omega_I_new = (1 / Nk) * w_b[0] * np.sum(T_kb)
-            diff = omega_I_prev - omega_I_new
-            omega_I_prev = omega_I_new
-
-            if verbose and diff > 0:
-                print("Warning: Omega_I is increasing.")
+        # bands inside each window at every k-point [*nks, n_bands]
+        if outer_window_type == "bands":
+            outer_mask = np.zeros(energies.shape, dtype=bool)
+            outer_mask[..., outer_band_idxs] = True
+        else:
+            outer_mask = (energies >= outer_energies[0]) & (energies <= outer_energies[1])
 
-            if verbose:
-                print(f"{i} Omega_I: {omega_I_new.real}")
-            
-            if abs(diff) * (iter_num - i) <= tol:
-                # assuming the change in omega_i monatonically decreases at this rate, 
-                # omega_i will not change more than tolerance with remaining steps
-                print("Omega_I has converged within tolerance. Breaking loop")
-                if inner_window is not None:
-                    min_keep = np.ma.masked_array(keep_states, mask=keep_mask)
-                    subspace = np.ma.concatenate((min_keep, inner_states), axis=-2)
-                    subspace_sliced = subspace[np.where(~subspace.mask)]
-                    subspace_sliced = subspace_sliced.reshape((*nks, N_wfs, n_orb))
-                    subspace_sliced = np.array(subspace_sliced)
-                    return subspace_sliced
-                else:
-                    return keep_states
-
-        # loop has ended
-        if inner_window is not None:
-            min_keep = np.ma.masked_array(keep_states, mask=keep_mask)
-            subspace = np.ma.concatenate((min_keep, inner_states), axis=-2)
-            subspace_sliced = subspace[np.where(~subspace.mask)]
-            subspace_sliced = subspace_sliced.reshape((*nks, N_wfs, n_orb))
-            subspace_sliced = np.array(subspace_sliced)
-            return subspace_sliced
+        inner_mask = np.zeros(energies.shape, dtype=bool)
+        if inner_window is None:
+            pass
+        elif inner_window_type == "bands":
+            inner_mask[..., inner_band_idxs] = True
         else:
-            return keep_states
+            inner_mask = (energies >= inner_energies[0]) & (energies <= inner_energies[1])
+
+        assert not np.any(inner_mask & ~outer_mask), "The inner window must lie inside the outer window."
+        N_inner = np.sum(inner_mask, axis=-1)
+        assert np.all(np.sum(outer_mask, axis=-1) >= N_wfs), "Outer window has less than N_wfs states at some k-points."
+        assert np.all(N_inner <= N_wfs), "Inner window has more than N_wfs states at some k-points."
+
+        # frozen states and the states of the outer window outside of the inner window, zero padded
+        inner_states, inner_valid = _pad_states(unk_states, inner_mask)
+        comp_states, comp_valid = _pad_states(unk_states, outer_mask & ~inner_mask)
+        num_keep = N_wfs - N_inner  # states taken from the complement at each k-point
+
+        min_states = self._get_init_subspace(comp_states, num_keep, comp_valid=comp_valid)
+        states_min = self._optimal_subspace_iter(
+            comp_states, num_keep, min_states, init_counts=num_keep, comp_valid=comp_valid, iter_num=iter_num, 
+            verbose=verbose, tol=tol, alpha=alpha, mixing=mixing, mix_history=mix_history, eig_solver=eig_solver)
+
+        # frozen and optimal states of each k-point packed into N_wfs rows
+        n_keep = states_min.shape[-2]
+        keep_valid = np.arange(n_keep) >= (n_keep - num_keep)[..., np.newaxis]
+        subspace, _ = _pad_states(
+            np.concatenate((inner_states, states_min), axis=-2), np.concatenate((inner_valid, keep_valid), axis=-1))
+        return subspace
         
 
     def find_optimal_subspace_bands(
         self, N_wfs=None, inner_bands=None, outer_bands="occupied", 
-        iter_num=100, verbose=False, tol=1e-10, alpha=1
+        iter_num=100, verbose=False, tol=1e-10, alpha=1, mixing="linear", mix_history=5, eig_solver="eigh"
     ):
         """Finds the subspaces throughout the BZ that minimizes the gauge-independent spread. 
 
         Used when the inner and outer windows correspond to bands rather than energy values. This function
         is faster when compared to energy windows. By specifying bands, the arrays have fixed sizes at each k-point
         and operations can be vectorized with numpy. 
+
+        Each iteration maps the averaged neighbor projector P_avg = sum_b w_b P_{k+b}, expressed in the 
+        basis of the window states, to a new one. `mixing` selects how the next P_avg is formed from the 
+        two, "linear" (with weight `alpha`) or "anderson" (Pulay mixing over the last `mix_history` 
+        iterations, see `mixing.AndersonMixer`). The Anderson history is cleared whenever Omega_I increases.
+
+        Only the top N_wfs - N_inner eigenvectors of P_avg are kept, and they change little between 
+        iterations. With `eig_solver="subspace"` they are refined from the previous ones by block subspace 
+        iteration instead of a full `eigh`, see `_top_eigvecs`. This requires 2 (N_wfs - N_inner) to be less
+        than the number of window states outside of the inner window. Otherwise a warning is raised and the
+        full `eigh` is used. Defaults to "eigh". Other values raise a ValueError.
         """
-        nks = self._nks 
-        Nk = np.prod(nks)
         n_orb = self.Lattice._n_orb
         n_occ = int(n_orb/2)
 
-        # Assumes only one shell for now
-        w_b, _, idx_shell = self.K_mesh.get_weights(N_sh=1)
-        num_nnbrs = self.K_mesh.num_nnbrs
-        bc_phase = self.K_mesh.bc_phase
-
         # initial subspace
         init_states = self.tilde_states
 
@@ -1166,124 +2014,187 @@ class Wannier():
 
         if outer_bands == "occupied":
             outer_bands = list(range(n_occ))
-        outer_states = self.energy_eigstates._u_wfs.take(outer_bands, axis=-2)
+
+        # manifold from which we borrow states to minimize omega_i
+        comp_bands = list(np.setdiff1d(outer_bands, inner_bands))
+        comp_states = self.energy_eigstates._u_wfs[..., comp_bands, :]
 
         if inner_bands is None:
             N_inner = 0
-            # Projector of initial tilde subspace at each k-point
-            P = init_states.get_projector()
-            P_nbr, Q_nbr = init_states.get_nbr_projector(return_Q=True)
-            T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
-            for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-                T_kb[..., idx] = np.trace(P[..., :, :] @ Q_nbr[..., idx, :, :], axis1=-1, axis2=-2)
-
-            P_min = np.copy(P)  # for start of iteration
-            P_nbr_min = np.copy(P_nbr)  # for start of iteration
-            Q_nbr_min = np.copy(Q_nbr)  # for start of iteration
+            min_states = init_states._u_wfs
         else:
             N_inner = len(inner_bands)
             inner_states = self.energy_eigstates._u_wfs.take(inner_bands, axis=-2)
+            min_states = self._get_init_subspace(comp_states, N_wfs - N_inner)
 
-            P_inner = np.einsum("...ni,...nj->...ij", inner_states, inner_states.conj())
-            P_inner = outer_states.conj() @ P_inner @ np.transpose(outer_states, axes=(0,1,3,2))
-            Q_inner = np.eye(P_inner.shape[-1]) - P_inner[..., :, :]
-
-            P_tilde = self.tilde_states.get_projector()
-            P_tilde = outer_states.conj() @ P_tilde @ np.transpose(outer_states, axes=(0,1,3,2))
-
-            MinMat = Q_inner @ P_tilde @ Q_inner
-            # chosing initial subspace as highest eigenvalues 
-            eigvals, eigvecs = np.linalg.eigh(MinMat)
-            min_states = np.einsum('...ij, ...ik->...jk', eigvecs[..., -(N_wfs-N_inner):], outer_states)
-
-            P = np.einsum("...ni,...nj->...ij", min_states, min_states.conj())
-            P_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-            Q_nbr = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-            T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
-            for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-                states_pbc = np.roll(min_states, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
-                P_nbr[..., idx, :, :] = np.einsum(
-                        "...ni, ...nj->...ij", states_pbc, states_pbc.conj()
-                        )
-                Q_nbr[..., idx, :, :] = np.eye(n_orb) - P_nbr[..., idx, :, :]
-                T_kb[..., idx] = np.trace(P[..., :, :] @ Q_nbr[..., idx, :, :], axis1=-1, axis2=-2)
-
-            P_min = np.copy(P)  # for start of iteration
-            P_nbr_min = np.copy(P_nbr)  # for start of iteration
-            Q_nbr_min = np.copy(Q_nbr)  # for start of iteration
+        # states spanning optimal subspace minimizing gauge invariant spread
+        states_min = self._optimal_subspace_iter(
+            comp_states, N_wfs - N_inner, min_states, iter_num=iter_num, verbose=verbose, 
+            tol=tol, alpha=alpha, mixing=mixing, mix_history=mix_history, eig_solver=eig_solver)
 
-        # manifold from which we borrow states to minimize omega_i
-        comp_bands = list(np.setdiff1d(outer_bands, inner_bands))
-        comp_states = self.energy_eigstates._u_wfs[..., comp_bands, :]
-        # print(comp_bands)
+        if inner_bands is not None:
+            return_states = np.concatenate((inner_states, states_min), axis=-2)
+            return return_states
+        else:
+            return states_min
 
-        # states spanning optimal subspace minimizing gauge invariant spread
-        states_min = np.zeros((*nks, N_wfs-N_inner, n_orb), dtype=complex)
-        omega_I_prev = (1 / Nk) * w_b[0] * np.sum(T_kb)
 
-        for i in range(iter_num):
-            P_avg = np.sum(w_b[0] * P_nbr_min, axis=-3)
-            Z = comp_states.conj() @ P_avg @ np.transpose(comp_states, axes=(0,1,3,2))
-            eigvals, eigvecs = np.linalg.eigh(Z) # [val, idx]
-            states_min = np.einsum('...ij, ...ik->...jk', eigvecs[..., -(N_wfs-N_inner):], comp_states)
-            print(f"{i} eigvals[0,0]: {eigvals[0,0]}")
+    def _get_init_subspace(self, comp_states, num_keep, comp_valid=None):
+        """
+        Initial subspace of the disentanglement, the `num_keep` states spanned by `comp_states` 
+        with the largest weight in the tilde subspace at each k-point. Padded like `_top_eigvecs`.
+        """
+        tilde_u = self.tilde_states._u_wfs.astype(comp_states.dtype, copy=False)
+        T = comp_states.conj() @ np.swapaxes(tilde_u, -1, -2)  # <w_k | u~_k>
+        Z = T @ np.swapaxes(T, -1, -2).conj()  # P~_k in the basis
+        if comp_valid is None:
+            comp_valid = np.ones(comp_states.shape[:-1], dtype=bool)
+        C, _ = _top_eigvecs(Z, comp_valid, num_keep, dim_k=self.K_mesh.dim, n_threads=self.n_threads)
+        return np.einsum('...ij, ...ik->...jk', C, comp_states)
 
-            P_new = np.einsum("...ni,...nj->...ij", states_min, states_min.conj())
-            
-            P_nbr_new = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-            Q_nbr_new = np.zeros((*nks, num_nnbrs, n_orb, n_orb), dtype=complex)
-            T_kb = np.zeros((*nks, num_nnbrs), dtype=complex)
-            for idx, idx_vec in enumerate(idx_shell[0]):  # nearest neighbors
-                states_pbc = np.roll(states_min, shift=tuple(-idx_vec), axis=(0,1)) * bc_phase[..., idx, np.newaxis,  :]
-                P_nbr_new[..., idx, :, :] = np.einsum(
-                        "...ni, ...nj->...ij", states_pbc, states_pbc.conj()
-                        )
-                
-                Q_nbr_new[..., idx, :, :] = np.eye(n_orb) - P_nbr_new[..., idx, :, :]
-                T_kb[..., idx] = np.trace(P_new[..., :, :] @ Q_nbr_new[..., idx, :, :], axis1=-1, axis2=-2)
-            
-            omega_I_new = (1 / Nk) * w_b[0] * np.sum(T_kb)
 
-            P_min = alpha * P_new + (1 - alpha) * P_min # for next iteration
-            P_nbr_min = alpha * P_nbr_new + (1 - alpha) * P_nbr_min # for next iteration
+    def _get_nbr_avg(self, C, M0, w_b, n_states=None, Z=None, M=None):
+        """
+        Averaged neighbor projector Z_k = sum_b w_b <w_k| P_{k+b} |w_k> and Omega_I of the subspace 
+        spanned by |s_{n,k}> = sum_m C_{mn,k} |w_{m,k}>, using only the overlaps M0 of the basis |w>.
+
+        With A_{k,b} = M0_{k,b} C_{k+b} = <w_k|s_{k+b}>, Z_k = sum_b w_b A_{k,b} A_{k,b}^dagger
+        and the overlaps of the subspace are C_k^dagger A_{k,b}.
+
+        Args:
+            C (np.ndarray): coefficients [*nks, n_w, n], zero columns are ignored
+            M0 (np.ndarray): overlaps <w_k|w_{k+b}> of the basis [*nks, b, n_w, n_w]
+            w_b (float): finite difference weight of the shell
+            n_states (int | np.ndarray, optional): number of states at each k-point, see `_get_omega_I_k`
+            Z, M (np.ndarray, optional): buffers for Z [*nks, n_w, n_w] and the overlaps [*nks, b, n, n]
+        """
+        dim_k, n_threads = self.K_mesh.dim, self.n_threads  # chunking of per-k kernels
+        nks, (n_w, n) = C.shape[:-2], C.shape[-2:]
+        if Z is None:
+            Z = np.empty((*nks, n_w, n_w), dtype=C.dtype)
+        if M is None:
+            M = np.empty((*nks, self.K_mesh.num_nnbrs, n, n), dtype=C.dtype)
+
+        # buffers reused for each neighbor
+        C_nbr = np.empty(C.shape, dtype=C.dtype)
+        A = np.empty(C.shape, dtype=C.dtype)
+        Z_b = np.empty(Z.shape, dtype=C.dtype)
+
+        C_dag = np.swapaxes(C, -1, -2).conj()
+        Z.fill(0)
+        for idx in range(self.K_mesh.num_nnbrs):  # nearest neighbors
+            self.K_mesh.get_nbr_gauge(C, idx=idx, out=C_nbr)
+            map_k_chunks(np.matmul, M0[..., idx, :, :], C_nbr, dim_k=dim_k, n_threads=n_threads, out=A)
+            map_k_chunks(np.matmul, C_dag, A, dim_k=dim_k, n_threads=n_threads, out=M[..., idx, :, :])
+            map_k_chunks(
+                np.matmul, A, np.swapaxes(A, -1, -2).conj(), dim_k=dim_k, n_threads=n_threads, out=Z_b)
+            Z += Z_b
+        Z *= w_b
+        return Z, np.sum(self._get_omega_I_k(M, w_b, n_states=n_states))
+
+
+    def _optimal_subspace_iter(
+        self, comp_states, num_keep, init_states, init_counts=None, comp_valid=None, iter_num=100, 
+        verbose=False, tol=1e-10, alpha=1, mixing="linear", mix_history=5, eig_solver="eigh"
+    ):
+        """
+        Fixed point iteration of the disentanglement, shared by the band and energy windows.
+
+        At each k-point, the states kept are the `num_keep` eigenvectors of 
+        Z_k = sum_b w_b <w_k| P_{k+b} |w_k> with the largest eigenvalues, where |w_k> are the 
+        `comp_states`. The iteration works with the coefficients of the states in this basis and the 
+        overlaps M0_{k,b} = <w_k|w_{k+b}> computed once, so no n_orb x n_orb projectors are formed.
+        Mixing acts on Z_k.
+
+        Args:
+            comp_states (np.ndarray): states the subspace is chosen from [*nks, n_comp, orb], zero padded
+            num_keep (int | np.ndarray): number of states kept at each k-point
+            init_states (np.ndarray): states spanning the initial subspace [*nks, n, orb]
+            init_counts (np.ndarray, optional): number of valid states of `init_states` when zero padded
+            comp_valid (np.ndarray, optional): valid rows of `comp_states` [*nks, n_comp]. None if all are valid.
+            iter_num, verbose, tol, alpha, mixing, mix_history, eig_solver: See `find_optimal_subspace_bands`.
+
+        Returns:
+            states_min (np.ndarray): 
+                Optimal states [*nks, max(num_keep), orb]. At k-points keeping fewer states the
+                leading rows are zero. With iter_num = 0, the initial states.
+        """
+        dtype = self.tilde_states._dtype  # working precision
+        dim_k, n_threads = self.K_mesh.dim, self.n_threads  # chunking of per-k kernels
+        nks = comp_states.shape[:-2]
+        n_comp, n_keep = comp_states.shape[-2], np.max(num_keep)
+        num_nnbrs = self.K_mesh.num_nnbrs
 
-            if verbose and omega_I_new > omega_I_prev:
-                print("Warning: Omega_I is increasing.")
+        # Assumes only one shell for now
+        w_b, _, _ = self.K_mesh.get_weights(N_sh=1)
+
+        comp_states = comp_states.astype(dtype, copy=False)
+        init_states = init_states.astype(dtype, copy=False)
+        if iter_num == 0:
+            return np.copy(init_states)
+        if comp_valid is None:
+            comp_valid = np.ones(comp_states.shape[:-1], dtype=bool)
+
+        # overlaps of the window states, the only quantity needing the orbital basis
+        M0 = self.K_mesh.get_overlap_mat(comp_states)
+
+        # averaged projector of the initial subspace at neighboring k-points
+        Z_avg = w_b[0] * _sum_outer(self.K_mesh.get_overlap_mat(comp_states, init_states))
+        omega_I_prev = np.sum(self._get_omega_I_k(self.K_mesh.get_overlap_mat(init_states), w_b[0], n_states=init_counts))
+
+        # buffers reused by every iteration
+        Z = np.empty(Z_avg.shape, dtype=dtype)
+        Z_new = np.empty(Z_avg.shape, dtype=dtype)
+        M_new = np.empty((*nks, num_nnbrs, n_keep, n_keep), dtype=dtype)
+
+        mixer = get_mixer(mixing, alpha=alpha, **({"history": mix_history} if mixing == "anderson" else {}))
+
+        # subspace iteration only pays off when the kept states are a small part of the window
+        if eig_solver not in ["eigh", "subspace"]:
+            raise ValueError(f"eig_solver must be 'eigh' or 'subspace', got {eig_solver!r}")
+        warm_start = eig_solver == "subspace" and 2 * n_keep < n_comp
+        if eig_solver == "subspace" and not warm_start:
+            warnings.warn(
+                f"eig_solver='subspace' needs the {n_keep} kept states to be less than half of the "
+                f"{n_comp} window states, using 'eigh' instead", stacklevel=2)
+
+        X = None  # top eigenvectors of the previous iteration
+        for i in range(iter_num):
+            Z[...] = Z_avg
+            C, X = _top_eigvecs(
+                Z, comp_valid, num_keep, dim_k=dim_k, n_threads=n_threads, X=X if warm_start else None)
+            _, omega_I_new = self._get_nbr_avg(C, M0, w_b[0], n_states=num_keep, Z=Z_new, M=M_new)
+
+            # mixing in place, Z_new is overwritten next iteration
+            Z_avg = mixer.mix(Z_avg, Z_new)
+            if omega_I_new > omega_I_prev:
+                mixer.reset()  # extrapolation overshot, restart from the current iterate
+                if verbose:
+                    print("Warning: Omega_I is increasing.")
             
             if abs(omega_I_prev - omega_I_new) * (iter_num - i) <= tol:
                 # assuming the change in omega_i monatonically decreases, omega_i will not change
                 # more than tolerance with remaining steps
                 print("Omega_I has converged within tolerance. Breaking loop")
-                if inner_bands is not None:
-                    return_states = np.concatenate((inner_states, states_min), axis=-2)
-                    return return_states
-                else:
-                    return states_min
+                break
 
             if verbose:
                 print(f"{i} Omega_I: {omega_I_new.real}")
 
             omega_I_prev = omega_I_new
 
-        if inner_bands is not None:
-            return_states = np.concatenate((inner_states, states_min), axis=-2)
-            return return_states
-        else:
-            return states_min
+        return np.einsum('...ij, ...ik->...jk', C, comp_states)
         
 
     def mat_exp(self, M):
-        eigvals, eigvecs = np.linalg.eig(M)
-        U = eigvecs
-        U_inv = np.linalg.inv(U)
-        # Diagonal matrix of the exponentials of the eigenvalues
-        exp_diagM = np.exp(eigvals)
-        # Construct the matrix exponential
-        expM = np.einsum('...ij, ...jk -> ...ik', U, np.multiply(U_inv, exp_diagM[..., :, np.newaxis]))
-        return expM
+        """General matrix exponential. The gauge updates use `unitary.unitary_update` instead."""
+        return exp_general(M)
     
     
-    def find_min_unitary(self, eps=1e-3, iter_num=100, verbose=False, tol=1e-10, grad_min=1e-3):
+    def find_min_unitary(
+            self, eps=1e-3, iter_num=100, verbose=False, tol=1e-10, grad_min=1e-3, update="eigh",
+            optimizer="sd", line_search=None, U_init=None, return_M=False, **opt_kwargs
+            ):
         """
         Finds the unitary that minimizing the gauge dependent part of the spread. 
 
@@ -1294,62 +2205,161 @@ class Wannier():
             verbose: Whether to print the spread at each iteration
             tol: If difference of spread is lower that tol for consecutive iterations,
                 the loop breaks
+            update: How the unitary step exp(eps * G) is formed, "eigh" (exact, Hermitian
+                eigendecomposition), "cayley" (Cayley transform) or "eig". See `unitary.unitary_update`.
+            optimizer: "sd" (fixed step steepest descent), "cg" (Polak-Ribiere conjugate gradient)
+                or "lbfgs" (L-BFGS). See `unitary.get_optimizer`. 
+            line_search: None (take the optimizer's step), "armijo" (backtracking) or "quadratic"
+                (parabolic fit, then backtracking) along the geodesic U exp(tD). The step multiplier t
+                adapts between iterations and the accepted values are stored in `self.step_history`.
+            U_init: Starting gauge relative to the tilde states [*nks, n, n]. Defaults to the identity.
+            return_M: Whether to also return the overlap matrix in the new gauge, 
+                which `set_tilde_gauge` takes instead of rotating the overlaps again.
+            opt_kwargs: Passed to the optimizer, e.g. `restart` for "cg" or `memory` for "lbfgs".
 
         Returns:
+            u_max_loc: The tilde states in the new gauge
             U: The unitary matrix
-            M: The rotated overlap matrix
+            M: The rotated overlap matrix, if return_M
         
         """
-        u_wfs = self.tilde_states._u_wfs
-        M = self.tilde_states._M
+        U, M = self._min_unitary(
+            self.tilde_states._M, eps=eps, iter_num=iter_num, verbose=verbose, tol=tol, grad_min=grad_min, 
+            update=update, optimizer=optimizer, line_search=line_search, U_init=U_init, **opt_kwargs
+            )
+        u_max_loc = np.einsum('...ji, ...jm -> ...im', U, self.tilde_states._u_wfs)
+        if return_M:
+            return u_max_loc, U, M
+        else:
+            return u_max_loc, U
+
+    def _min_unitary(
+            self, M, eps=1e-3, iter_num=100, verbose=False, tol=1e-10, grad_min=1e-3, update="eigh",
+            optimizer="sd", line_search=None, U_init=None, **opt_kwargs
+            ):
+        """
+        Gauge minimization loop of `find_min_unitary` on the overlaps M [*nks, b, n, n].
+
+        Only uses the overlaps and the mesh (`K_mesh`, `_nks`, `n_threads`), so it also runs on the
+        bare objects of the multi-start workers.
+
+        Returns:
+            U: The unitary matrix relative to the gauge of M
+            M: The overlap matrix rotated to the gauge U
+        """
         w_b, k_shell, idx_shell = self.K_mesh.get_weights()
         # Assumes only one shell for now
         w_b, k_shell, idx_shell = w_b[0], k_shell[0], idx_shell[0]
         nks = self._nks
         Nk = np.prod(nks)
-        num_state = self.tilde_states._n_states
-
-        U = np.zeros((*nks, num_state, num_state), dtype=complex)  # unitary transformation
-        U[...] = np.eye(num_state, dtype=complex)  # initialize as identity
-        M0 = np.copy(M)  # initial overlap matrix
-        M = np.copy(M)  # new overlap matrix
+        num_state = M.shape[-1]
+
+        dtype = M.dtype  # working precision
+        dim_k, n_threads = self.K_mesh.dim, self.n_threads  # chunking of per-k kernels
+        k_axes = tuple(range(dim_k))
+
+        # buffers of every iteration, kept for later minimizations of the same size
+        num_nnbrs = M.shape[-3]
+        ws = getattr(self, "_gauge_ws", None)
+        if ws is None or not ws.fits(nks, num_nnbrs, num_state, dtype):
+            ws = self._gauge_ws = Gauge_workspace(nks, num_nnbrs, num_state, dtype=dtype)
+
+        ws.M0[...] = M  # initial overlap matrix
+        if U_init is None:
+            ws.U[...] = np.eye(num_state, dtype=dtype)  # unitary transformation, initialize as identity
+            ws.M[...] = M  # new overlap matrix
+        else:
+            ws.U[...] = U_init
+            self._rotate_overlaps(ws.M0, ws.U, out=ws.M)
+        M = ws.M
 
         # initializing
-        omega_tilde_prev = self._get_Omega_til(M, w_b, k_shell)
+        opt = get_optimizer(optimizer, eps, update=update, **opt_kwargs)
+        if dtype == np.complex128:
+            abs_M_sq = np.vdot(M, M).real  # gauge invariant
+        else:
+            # U is only unitary to single precision, sum |M|^2 is recomputed from M at each step
+            abs_M_sq = None
+        omega_tilde_prev, _, G = self._get_Omega_til_grad(M, w_b, k_shell, abs_M_sq=abs_M_sq, ws=ws)
         grad_mag_prev = 0
-        eta = 1
+        self.step_history = []  # accepted multiples t of the optimizer's step
+        t_init = 1.0
+        opt_restarted = False
         for i in range(iter_num):
-            log_diag_M_imag = np.log(np.diagonal(M, axis1=-1, axis2=-2)).imag
-            r_n = -(1 / Nk) * w_b * np.sum(
-                log_diag_M_imag, axis=(0,1)).T @ k_shell
-            q = log_diag_M_imag + (k_shell @ r_n.T)
-            R = np.multiply(M, np.diagonal(M, axis1=-1, axis2=-2)[..., np.newaxis, :].conj())
-            T = np.multiply(np.divide(M, np.diagonal(M, axis1=-1, axis2=-2)[..., np.newaxis, :]), q[..., np.newaxis, :])
-            A_R = (R - np.transpose(R, axes=(0,1,2,4,3)).conj()) / 2
-            S_T = (T + np.transpose(T, axes=(0,1,2,4,3)).conj()) / (2j)
-            G = 4 * w_b * np.sum(A_R - S_T, axis=-3)
-            U = np.einsum("...ij, ...jk -> ...ik", U, self.mat_exp(eta * eps * G))
-
-            for idx, idx_vec in enumerate(idx_shell):
-                M[..., idx, :, :] = (
-                    np.transpose(U, axes=(0,1,3,2)).conj()[..., :, :] @  M0[..., idx, :, :] 
-                                    @ np.roll(U, shift=tuple(-idx_vec), axis=(0,1))[..., :, :]
-                                    )
-
-            grad_mag = np.linalg.norm(np.sum(G, axis=(0,1)))
-            omega_tilde_new = self._get_Omega_til(M, w_b, k_shell)
+            # G is anti-Hermitian, so the step stays unitary to machine precision
+            D = opt.direction(G, out=ws.D)
+
+            if line_search is None:
+                dU = map_k_chunks(
+                    lambda A, out: unitary_update(A, method=update, out=out), D, 
+                    dim_k=dim_k, n_threads=n_threads, out=ws.dU
+                    )
+                map_k_chunks(np.matmul, ws.U, dU, dim_k=dim_k, n_threads=n_threads, out=ws.U_new)
+                ws.U, ws.U_new = ws.U_new, ws.U
+                opt.step_taken(D)
+
+                # M_{k,b} = U_k^dag M0_{k,b} U_{k+b} for all neighbors at once
+                self.K_mesh.get_nbr_gauge(ws.U, out=ws.U_nbr)
+                np.conjugate(np.swapaxes(ws.U, -1, -2), out=ws.U_dag)
+                map_k_chunks(
+                    np.matmul, ws.U_dag[..., np.newaxis, :, :], ws.M0, 
+                    dim_k=dim_k, n_threads=n_threads, out=ws.UM0
+                    )
+                map_k_chunks(np.matmul, ws.UM0, ws.U_nbr, dim_k=dim_k, n_threads=n_threads, out=M)
+            else:
+                # slope of Omega_tilde along the geodesic U exp(tD) at t = 0
+                slope = -np.real(np.vdot(G, D)) / Nk
+                if slope >= 0:  # not a descent direction, restart the optimizer
+                    opt.reset()
+                    D = opt.direction(G, out=ws.D)
+                    slope = -np.real(np.vdot(G, D)) / Nk
+
+                t, dU, M_t, _ = self._gauge_line_search(
+                    M, D, omega_tilde_prev, slope, min(t_init, opt.max_step), 
+                    method=line_search, update=update, abs_M_sq=abs_M_sq
+                    )
+                if t == 0:
+                    if opt_restarted:
+                        # not even a steepest descent step decreases Omega_tilde, at the minimum within precision
+                        print("Line search found no decrease of Omega_tilde. Breaking the loop")
+                        break
+                    opt.reset()
+                    opt_restarted = True
+                    continue
+
+                opt_restarted = False
+                M[...] = M_t
+                map_k_chunks(np.matmul, ws.U, dU, dim_k=dim_k, n_threads=n_threads, out=ws.U_new)
+                ws.U, ws.U_new = ws.U_new, ws.U
+                opt.step_taken(t * D)
+                self.step_history.append(t)
+                # grow the next trial step if the full step was accepted
+                t_init = 2 * t if t >= min(t_init, opt.max_step) else t
+
+            if dtype != np.complex128 and (i + 1) % _single_reunitarize_steps == 0:
+                # nearest unitary (polar decomposition) and the overlaps rotated from M0 in that gauge
+                V, _, Wh = np.linalg.svd(ws.U)
+                np.matmul(V, Wh, out=ws.U)
+                self._rotate_overlaps(ws.M0, ws.U, out=M)
+
+            grad_mag = np.linalg.norm(np.sum(G, axis=k_axes))
+            # spread and descent direction at the new gauge, G is overwritten in place
+            omega_tilde_new, _, G = self._get_Omega_til_grad(M, w_b, k_shell, abs_M_sq=abs_M_sq, ws=ws)
 
             if abs(grad_mag) <= grad_min and abs(omega_tilde_prev - omega_tilde_new) * (iter_num - i) <= tol:
                 print("Omega_tilde minimization has converged within tolerance. Breaking the loop")
                 print(
                 f"{i} Omega_til = {omega_tilde_new.real}, Grad mag: {grad_mag}"
                 )
-                u_max_loc = np.einsum('...ji, ...jm -> ...im', U, u_wfs)
-                return u_max_loc, U
+                break
             
             if grad_mag_prev < grad_mag and i!=0:
                 print("Warning: Gradient increasing.")
 
+            if omega_tilde_new > omega_tilde_prev:
+                # search history no longer describes the landscape, restart from steepest descent
+                opt.reset()
+
             if verbose:
                 print(
                     f"{i} Omega_til = {omega_tilde_new.real}, Grad mag: {grad_mag}"
@@ -1357,9 +2367,142 @@ class Wannier():
             grad_mag_prev = grad_mag
             omega_tilde_prev = omega_tilde_new
 
+        return np.copy(ws.U), np.copy(ws.M)  # the workspace is reused by later minimizations
+
+    def _rotate_overlaps(self, M, U, out=None):
+        """Overlaps in the gauge U, M'_{k,b} = U_k^dagger M_{k,b} U_{k+b}."""
+        U_nbr = self.K_mesh.get_nbr_gauge(U)
+        M_rot = np.matmul(np.swapaxes(U, -1, -2).conj()[..., np.newaxis, :, :], M, out=out)
+        return np.matmul(M_rot, U_nbr, out=M_rot)
+
+    def find_min_unitary_multistart(
+            self, n_starts=8, n_keep=2, iter_num_explore=100, iter_num=1000, perturb=0.5, 
+            n_procs=None, seed=None, return_M=False, **min_kwargs
+            ):
+        """
+        Gauge minimization from several starting gauges to avoid getting stuck in a local minimum.
+
+        The projection gauge (identity) and n_starts - 1 random perturbations of it, 
+        U_k = exp(perturb * A_k) with A_k Gaussian anti-Hermitian, are minimized for 
+        `iter_num_explore` iterations in a process pool. The `n_keep` lowest Omega_tilde
+        candidates are continued for `iter_num` iterations and the best gauge is returned.
+
+        Args:
+            n_starts (int): number of starting gauges, including the projection gauge
+            n_keep (int): number of candidates continued after the exploration
+            iter_num_explore (int): iterations of the exploration stage
+            iter_num (int): iterations of the continued candidates
+            perturb (float): scale of the random anti-Hermitian generators
+            n_procs (int, optional): number of processes. Defaults to the number of CPUs.
+            seed (int, optional): seed of the random perturbations
+            return_M (bool): whether to also return the overlap matrix in the best gauge
+            min_kwargs: passed to `find_min_unitary`, e.g. eps, optimizer, line_search, tol
+
+        Returns:
+            u_max_loc, U: states in the best gauge and the gauge relative to the tilde states,
+            followed by the rotated overlap matrix if return_M.
+            The Omega_tilde of every start after each stage is stored in `self.multistart_history`.
+        """
+        rng = np.random.default_rng(seed)
+        nks = self._nks
+        n_wfs = self.tilde_states._n_states
+        dtype = self.tilde_states._dtype
+
+        U_starts = [np.broadcast_to(np.eye(n_wfs, dtype=dtype), (*nks, n_wfs, n_wfs)).copy()]
+        for _ in range(n_starts - 1):
+            A = rng.normal(size=(*nks, n_wfs, n_wfs)) + 1j * rng.normal(size=(*nks, n_wfs, n_wfs))
+            A = perturb * (A - np.swapaxes(A, -1, -2).conj()) / 2
+            U_starts.append(exp_antiherm(A).astype(dtype, copy=False))
+
+        explore_kwargs = dict(min_kwargs, iter_num=iter_num_explore)
+        refine_kwargs = dict(min_kwargs, iter_num=iter_num)
+        with ProcessPoolExecutor(
+            max_workers=n_procs, initializer=_init_multistart_worker,
+            initargs=(self.tilde_states._M, self.K_mesh, self._nks, self.n_threads)
+            ) as pool:
+            explored = list(pool.map(_multistart_worker, U_starts, [explore_kwargs] * n_starts))
+            order = np.argsort([omega for omega, _ in explored])[:n_keep]
+            # only the continued candidates send back their overlaps
+            refined = list(pool.map(
+                _multistart_worker, [explored[i][1] for i in order], [refine_kwargs] * len(order),
+                [True] * len(order)
+                ))
+
+        self.multistart_history = {
+            "explore": [omega for omega, _ in explored],
+            "kept": [int(i) for i in order],
+            "refine": [omega for omega, _, _ in refined],
+            }
+        _, U, M = min(refined, key=lambda res: res[0])
+        u_max_loc = np.einsum('...ji, ...jm -> ...im', U, self.tilde_states._u_wfs)
+        if return_M:
+            return u_max_loc, U, M
+        else:
+            return u_max_loc, U
+
+    def _gauge_line_search(
+            self, M, D, omega_0, slope, t_init, method="armijo", update="eigh", c1=1e-4, max_backtrack=30,
+            abs_M_sq=None
+            ):
+        """
+        Line search for the step t along the geodesic U exp(tD) of the gauge minimization.
+
+        Trial steps only rotate the cached overlaps, M_{k,b}(t) = dU_k^dag M_{k,b} dU_{k+b} with
+        dU = exp(tD), and evaluate Omega_tilde.
 
-        u_max_loc = np.einsum('...ji, ...jm -> ...im', U, u_wfs)
-        return u_max_loc, U
+        Args:
+            M (np.ndarray): overlap matrix at the current gauge
+            D (np.ndarray): proposed step (anti-Hermitian) [*nks, n, n]
+            omega_0 (float): Omega_tilde at the current gauge
+            slope (float): derivative of Omega_tilde along the geodesic at t = 0
+            t_init (float): first trial step
+            method (str): "armijo" for backtracking, "quadratic" to first try the minimum of the parabola
+                through omega_0, slope and the first trial. Defaults to "armijo".
+            update (str): unitary step, see `unitary.unitary_update`
+            c1 (float): sufficient decrease constant of the Armijo condition
+            max_backtrack (int): maximum number of step halvings
+            abs_M_sq (float, optional): gauge invariant sum |M|^2, see `_get_Omega_til_grad`
+
+        Returns:
+            t, dU, M_t, omega_t: accepted step, the unitary exp(tD), rotated overlaps and Omega_tilde
+        """
+        assert method in ("armijo", "quadratic"), "line_search must be None, 'armijo' or 'quadratic'"
+        w_b, k_shell, _ = self.K_mesh.get_weights()
+        w_b, k_shell = w_b[0], k_shell[0]
+        dim_k, n_threads = self.K_mesh.dim, self.n_threads
+
+        def trial(t):
+            dU = map_k_chunks(
+                lambda A: unitary_update(A, method=update), t * D, dim_k=dim_k, n_threads=n_threads)
+            dU_nbr = self.K_mesh.get_nbr_gauge(dU)
+            M_t = map_k_chunks(
+                np.matmul, np.swapaxes(dU, -1, -2).conj()[..., np.newaxis, :, :], M, 
+                dim_k=dim_k, n_threads=n_threads
+                )
+            map_k_chunks(np.matmul, M_t, dU_nbr, dim_k=dim_k, n_threads=n_threads, out=M_t)
+            return dU, M_t, self._get_Omega_til(M_t, w_b, k_shell, abs_M_sq=abs_M_sq)
+
+        t = t_init
+        dU, M_t, omega_t = trial(t)
+
+        if method == "quadratic":
+            # minimum of omega_0 + slope * t + c t^2 through the first trial
+            curv = (omega_t - omega_0 - slope * t) / t**2
+            if curv > 0 and np.isfinite(curv):
+                t_quad = np.clip(-slope / (2 * curv), t / 10, 10 * t)
+                dU_q, M_q, omega_q = trial(t_quad)
+                if omega_q < omega_t:
+                    t, dU, M_t, omega_t = t_quad, dU_q, M_q, omega_q
+
+        for _ in range(max_backtrack):
+            if omega_t <= omega_0 + c1 * t * slope:  # sufficient decrease
+                return t, dU, M_t, omega_t
+            t /= 2
+            dU, M_t, omega_t = trial(t)
+
+        if omega_t <= omega_0 + c1 * t * slope:
+            return t, dU, M_t, omega_t
+        return 0, None, M, omega_0  # no acceptable step
 
     def max_loc(
         self,
@@ -1375,7 +2518,16 @@ class Wannier():
         tol_omega_til=1e-10,
         grad_min=1e-3,
         alpha=1,
+        mixing="linear",
+        mix_history=5,
+        eig_solver="eigh",
         verbose=False,
+        refine_double=True,
+        iter_num_refine=100,
+        update="eigh",
+        optimizer="sd",
+        line_search=None,
+        n_starts=1,
     ):
         """
         Find the maximally localized Wannier functions using the projection method.
@@ -1384,6 +2536,25 @@ class Wannier():
             outer_states_idxs(list | str): Band indices for the disentanglement manifold. If "occupied", 
                 will use the occupied manifold. Defaults to "occupied".
             verbose(bool): Whether to print spread during minimization.
+            mixing(str): Mixing of the disentanglement iterations, "linear" (weight `alpha`) or "anderson".
+                Defaults to "linear".
+            mix_history(int): Number of iterations kept by Anderson mixing. Defaults to 5.
+            eig_solver(str): Eigensolver of the disentanglement, "eigh" (full) or "subspace" (warm started
+                subspace iteration for the kept states). "subspace" needs the N_wfs - N_inner kept states to be
+                less than half of the outer window states outside of the inner window. Otherwise a warning is 
+                raised and "eigh" is used. Defaults to "eigh".
+            refine_double(bool): When running in single precision, refine the gauge for `iter_num_refine` 
+                more iterations in double precision after the gauge optimization. The Wannier functions, 
+                spreads and centers are those of the double precision states (`spread_precision` is "double"), 
+                then the states are recast and later calls run in single precision again. Defaults to True.
+            iter_num_refine(int): Number of double precision refinement iterations. Defaults to 100.
+            update(str): Unitary step used by `find_min_unitary`, "eigh", "cayley" or "eig". Defaults to "eigh".
+            optimizer(str): Gauge optimizer used by `find_min_unitary`, "sd" (steepest descent), "cg" 
+                (conjugate gradient) or "lbfgs". Defaults to "sd".
+            line_search(str | None): Step size search of `find_min_unitary`, None (fixed step), "armijo" or
+                "quadratic". Defaults to None.
+            n_starts(int): If larger than 1, the gauge is minimized from this many starting gauges in a 
+                process pool, see `find_min_unitary_multistart`. Defaults to 1.
         """
 
         if twfs_omega_i is not None:
@@ -1403,7 +2574,8 @@ class Wannier():
             outer_window=outer_window,
             inner_window=inner_window,
             iter_num=iter_num_omega_i,
-            verbose=verbose, alpha=alpha, tol=tol_omega_i
+            verbose=verbose, alpha=alpha, tol=tol_omega_i, mixing=mixing, mix_history=mix_history,
+            eig_solver=eig_solver
         )
     
         self.set_tilde_states(util_min_Wan, cell_periodic=True)
@@ -1428,10 +2600,27 @@ class Wannier():
         self.report()
 
         # Finding optimal gauge
-        u_max_loc, _ = self.find_min_unitary(
-            eps=eps, iter_num=iter_num_omega_til, verbose=verbose, tol=tol_omega_til, grad_min=grad_min)
+        if n_starts > 1:
+            _, U, M = self.find_min_unitary_multistart(
+                n_starts=n_starts, iter_num=iter_num_omega_til, eps=eps, verbose=verbose, tol=tol_omega_til, 
+                grad_min=grad_min, update=update, optimizer=optimizer, line_search=line_search, return_M=True)
+        else:
+            _, U, M = self.find_min_unitary(
+                eps=eps, iter_num=iter_num_omega_til, verbose=verbose, tol=tol_omega_til, grad_min=grad_min,
+                update=update, optimizer=optimizer, line_search=line_search, return_M=True)
         
-        self.set_tilde_states(u_max_loc, cell_periodic=True)
+        # only the gauge changed, the minimization already has the overlaps in the new gauge
+        self.set_tilde_gauge(U, M=M)
+
+        refine = refine_double and self._precision == "single"
+        if refine:
+            # last steps in double precision, starting from the single precision minimum
+            print("Refining in double precision")
+            self.set_precision("double")
+            _, U, M = self.find_min_unitary(
+                eps=eps, iter_num=iter_num_refine, verbose=verbose, tol=tol_omega_til, grad_min=grad_min,
+                update=update, optimizer=optimizer, line_search=line_search, return_M=True)
+            self.set_tilde_gauge(U, M=M)
         print("min omegatil", self.tilde_states._u_wfs.shape)
 
         # Fourier transform Bloch-like states
@@ -1440,6 +2629,10 @@ class Wannier():
         # DFT
         self.WFs = np.fft.ifftn(psi_wfs, axes=[i for i in range(dim_k)], norm=None)
 
+        if refine:
+            # the Wannier functions and spreads keep the refined double precision result
+            self.set_precision("single", update_spread=False)
+
         # spread = self.spread_recip(decomp=True)
         # self.spread = spread[0][0]
         # self.omega_i = spread[0][1]
@@ -1447,43 +2640,69 @@ class Wannier():
         # self.centers = spread[1]
 
 
-    def interp_energies(self, k_path, wan_idxs=None, ret_eigvecs=False):
+    def get_H_R(self, wan_idxs=None, ws=True):
+        """
+        Real space Hamiltonian of the tilde states, H_mn(R) = (1/Nk) sum_k e^{-i 2pi k.R} <u~_mk|H_k|u~_nk>.
+
+        Computed with one FFT over the k axes of the rotated Hamiltonian, in any dimension. 
+        The result is cached until the tilde states change.
+
+        Args:
+            wan_idxs (np.ndarray, optional): Indices of the tilde states to keep, see `interp_energies`.
+            ws (bool): 
+                If True, the lattice vectors are the Wigner-Seitz vectors of the mesh supercell with their
+                degeneracies (see `K_mesh.get_WS_R_vecs`). Otherwise the FFT grid, 
+                -nk_i//2 <= R_i < nk_i - nk_i//2, with unit degeneracies. Defaults to True.
+
+        Returns:
+            H_R (np.ndarray): Shape is n_R x n_wfs x n_wfs.
+            R_vecs (np.ndarray): Lattice vectors in reduced coordinates. Shape is n_R x dim_k.
+            deg (np.ndarray): Degeneracy of each lattice vector. Shape is n_R.
+        """
+        key = (None if wan_idxs is None else np.asarray(wan_idxs).tobytes(), ws)
+        if key in self._H_R_cache:
+            return self._H_R_cache[key]
+
         u_tilde = self.get_tilde_states()["Cell periodic"]
         if wan_idxs is not None:
             u_tilde = np.take_along_axis(u_tilde, wan_idxs, axis=-2)
         H_k = self.get_Bloch_Ham()
-        H_rot_k = u_tilde[..., :, :].conj() @ H_k @ np.transpose(u_tilde[..., : ,:], axes=(0,1,3,2))
-
-        k_mesh = self.K_mesh.full_mesh
-        k_idx_arr = self.K_mesh.idx_arr
-        nkx, nky = self.K_mesh.nks
-        Nk = np.prod([self.K_mesh.nks])
-
-        supercell = np.array([
-            (i,j) 
-            for i in range(-int((nkx-nkx%2)/2), int((nkx-nkx%2)/2)) for j in range(-int((nky-nky%2)/2), int((nky-nky%2)/2))
-            ])
-
-        H_R = np.zeros((supercell.shape[0], H_rot_k.shape[-1], H_rot_k.shape[-1]), dtype=complex)
-        for idx, (x, y) in enumerate(supercell):
-            for k_idx in k_idx_arr:
-                R_vec = np.array([x, y])
-                phase = np.exp(-1j * 2 * np.pi * np.vdot(k_mesh[k_idx], R_vec))
-                H_R[idx, :, :] += H_rot_k[k_idx] * phase / Nk
-
-        H_k_interp = np.zeros((k_path.shape[0], H_R.shape[-1], H_R.shape[-1]), dtype=complex)
-        for k_idx, k in enumerate(k_path):
-            for idx, (x, y) in enumerate(supercell):
-                R_vec = np.array([x, y])
-                phase = np.exp(1j * 2 * np.pi * np.vdot(k, R_vec))
-                H_k_interp[k_idx] += H_R[idx] * phase
-
-        eigvals, eigvecs = np.linalg.eigh(H_k_interp)
+        H_rot_k = u_tilde.conj() @ H_k @ np.swapaxes(u_tilde, -1, -2)
 
-        if ret_eigvecs:
-            return eigvals, eigvecs
+        nks = self.K_mesh.nks
+        dim_k = len(nks)
+        # e^{-i 2pi k.R} with k = n/nk, entry m of the FFT is R = m (mod nk)
+        H_R = np.fft.fftn(H_rot_k, axes=list(range(dim_k))) / np.prod(nks)
+
+        if ws:
+            R_vecs, deg = self.K_mesh.get_WS_R_vecs()
         else:
-            return eigvals
+            R_vecs = np.stack(np.meshgrid(*[np.fft.fftfreq(nk, d=1 / nk) for nk in nks], indexing="ij"), axis=-1)
+            R_vecs = np.rint(R_vecs).astype(int).reshape(-1, dim_k)
+            deg = np.ones(R_vecs.shape[0], dtype=int)
+        H_R = H_R[tuple((R_vecs % np.array(nks)).T)]
+
+        self._H_R_cache[key] = (H_R, R_vecs, deg)
+        return self._H_R_cache[key]
+
+
+    def get_interp_model(self, wan_idxs=None, ws=True):
+        """
+        Wannier interpolated model of the tilde states, see `Interp_model`.
+
+        Args:
+            wan_idxs (np.ndarray, optional): Indices of the tilde states to keep, see `get_H_R`.
+            ws (bool): Whether to use Wigner-Seitz lattice vectors, see `get_H_R`. Defaults to True.
+        """
+        return Interp_model(*self.get_H_R(wan_idxs=wan_idxs, ws=ws))
+
+
+    def interp_energies(self, k_path, wan_idxs=None, ret_eigvecs=False):
+        """
+        Wannier interpolated energies along `k_path` [..., dim_k]. To evaluate many batches of
+        k-points, get the model once with `get_interp_model` instead.
+        """
+        return self.get_interp_model(wan_idxs=wan_idxs).solve(k_path, ret_eigvecs=ret_eigvecs)
 
 
     def report(self):
@@ -1500,6 +2719,7 @@ class Wannier():
             print(f"w_{i} --> {center.round(5)}")
         print(rf"Omega_i = {self.omega_i}")
         print(rf"Omega_tilde = {self.omega_til}")
+        print(f"Precision = {np.dtype(_precision_dtypes[self.spread_precision]).name}")
         
 
 
@@ -0,0 +1,261 @@
+import numpy as np
+
+# Unitary updates U -> U exp(A) for the gauge optimization. The steepest descent direction G of
+# Omega_tilde is anti-Hermitian, so the update can be built from a Hermitian eigendecomposition
+# (exact exponential) or from the Cayley transform (no eigensolve). Both are unitary to machine
+# precision, unlike exponentials built from `np.linalg.eig` and `np.linalg.inv`.
+
+
+def exp_antiherm(A, out=None):
+    """
+    Matrix exponential exp(A) of a batch of anti-Hermitian matrices.
+
+    With H = iA Hermitian, H = V diag(w) V^dagger gives exp(A) = V diag(exp(-iw)) V^dagger.
+
+    Args:
+        A (np.ndarray): anti-Hermitian matrices [..., n, n]
+        out (np.ndarray, optional): buffer for the result
+
+    Returns:
+        expA (np.ndarray): unitary matrices [..., n, n]
+    """
+    H = 1j * A
+    H = (H + np.swapaxes(H, -1, -2).conj()) / 2  # remove the round-off non-Hermitian part
+    eigvals, eigvecs = np.linalg.eigh(H)
+    phases = np.exp(-1j * eigvals).astype(eigvecs.dtype, copy=False)
+    return np.matmul(eigvecs * phases[..., np.newaxis, :], np.swapaxes(eigvecs, -1, -2).conj(), out=out)
+
+
+def cayley(A, out=None):
+    """
+    Cayley transform (1 - A/2)^{-1} (1 + A/2) of a batch of anti-Hermitian matrices.
+
+    Agrees with exp(A) up to O(A^3) and is exactly unitary, requiring only a linear solve.
+
+    Args:
+        A (np.ndarray): anti-Hermitian matrices [..., n, n]
+        out (np.ndarray, optional): buffer for the result
+
+    Returns:
+        U (np.ndarray): unitary matrices [..., n, n]
+    """
+    eye = np.eye(A.shape[-1], dtype=A.dtype)
+    U = np.linalg.solve(eye - A / 2, eye + A / 2)
+    if out is None:
+        return U
+    out[...] = U
+    return out
+
+
+def exp_general(A, out=None):
+    """
+    Matrix exponential of a batch of diagonalizable matrices through `np.linalg.eig`.
+
+    Kept for matrices that are not anti-Hermitian.
+    """
+    eigvals, eigvecs = np.linalg.eig(A)
+    eigvecs_inv = np.linalg.inv(eigvecs)
+    # Diagonal matrix of the exponentials of the eigenvalues
+    exp_diag = np.exp(eigvals)
+    # Construct the matrix exponential
+    return np.einsum(
+        '...ij, ...jk -> ...ik', eigvecs, np.multiply(eigvecs_inv, exp_diag[..., :, np.newaxis]), out=out)
+
+
+_update_methods: dict = {"eigh": exp_antiherm, "cayley": cayley, "eig": exp_general}
+
+
+def unitary_update(A, method: str = "eigh", out=None):
+    """
+    Unitary step exp(A) (or its Cayley approximation) for an anti-Hermitian generator A.
+
+    Args:
+        A (np.ndarray): anti-Hermitian matrices [..., n, n], e.g. eps * G
+        method (str):
+            "eigh" for the exact exponential from a Hermitian eigendecomposition, "cayley" for
+            the Cayley transform, or "eig" for the general eigendecomposition. Defaults to "eigh".
+        out (np.ndarray, optional): buffer for the result
+
+    Returns:
+        dU (np.ndarray): unitary matrices [..., n, n]
+    """
+    assert method in _update_methods, f"method must be one of {list(_update_methods)}"
+    return _update_methods[method](A, out=out)
+
+
+####### Optimizers on the unitary group ############
+
+# Gauges are updated as U_k -> U_k exp(D_k), so tangent vectors are stored as the anti-Hermitian
+# generators D_k ("body" coordinates). Along the geodesic U exp(tD), the Levi-Civita parallel
+# transport of the bi-invariant metric acts on generators as X -> E^dagger X E, E = exp(D/2).
+# It leaves D itself unchanged. The optimizers take the steepest descent direction G
+# (minus the gradient) at the current gauge and return the step D.
+
+
+def inner(X, Y):
+    """Real inner product sum_k Re tr(X_k^dagger Y_k) of two batches of matrices."""
+    return np.real(np.vdot(X, Y))
+
+
+def transport(X, E):
+    """Parallel transport E^dagger X E of the generators X along a step with half-step unitary E."""
+    return np.swapaxes(E, -1, -2).conj() @ X @ E
+
+
+class SteepestDescent:
+    # largest multiple of the proposed step a line search may try
+    max_step = np.inf
+
+    def __init__(self, eps, update="eigh"):
+        """
+        Fixed step steepest descent, D = eps * G.
+
+        Args:
+            eps (float): step size
+            update (str): unitary step used by `transport`, see `unitary_update`
+        """
+        self.eps = eps
+        self.update = update
+        self.reset()
+
+    def reset(self):
+        """Forgets the search history."""
+        pass
+
+    def direction(self, G, out=None):
+        """
+        Step D to take from the current gauge given the steepest descent direction G.
+
+        `out` is an optional buffer for the step. Optimizers that keep a history of steps
+        return arrays of their own instead.
+        """
+        return np.multiply(G, self.eps, out=out)
+
+    def step_taken(self, D):
+        """Called after the gauge moved by exp(D), before the next `direction`."""
+        pass
+
+
+class ConjugateGradient(SteepestDescent):
+    max_step = 1.0  # steps are already scaled by the curvature
+
+    def __init__(self, eps, update="eigh", restart=50):
+        """
+        Polak-Ribiere conjugate gradient, P = G + beta * P_prev with beta = max(beta_PR, 0).
+
+        The direction restarts from G every `restart` iterations, when beta_PR < 0, and when
+        the conjugate direction is not a descent direction. The step D = a P minimizes the
+        quadratic model along P, with the curvature s.y / s.s measured on the previous step.
+
+        Args:
+            eps (float): step size of the first iteration and when the curvature is not positive
+            update (str): unitary step used by `transport`, see `unitary_update`
+            restart (int): number of iterations between restarts. Defaults to 50.
+        """
+        self.restart = restart
+        super().__init__(eps, update=update)
+
+    def reset(self):
+        self._G_prev = None  # transported G and search direction of the previous iteration
+        self._P_prev = None
+        self._s = None
+        self._num_iter = 0
+
+    def direction(self, G, out=None):
+        P = G
+        step = self.eps
+        if self._G_prev is not None:
+            # curvature along the previous step, y is the change of the gradient -G
+            s, y = self._s, self._G_prev - G
+            ss = inner(s, s)
+            curv = inner(s, y) / ss if ss > 0 else 0
+
+            if self._num_iter % self.restart != 0:
+                beta = inner(G, G - self._G_prev) / inner(self._G_prev, self._G_prev)
+                if beta > 0:
+                    P = G + beta * self._P_prev
+                    if inner(G, P) <= 0:  # not a descent direction
+                        P = G
+            if curv > 0:
+                step = inner(G, P) / (curv * inner(P, P))
+
+        self._G, self._P = G, P
+        self._num_iter += 1
+        return step * P
+
+    def step_taken(self, D):
+        E = unitary_update(D / 2, method=self.update)
+        self._G_prev = transport(self._G, E)
+        self._P_prev = transport(self._P, E)
+        self._s = D  # invariant under its own transport
+
+
+class LBFGS(SteepestDescent):
+    max_step = 1.0  # quasi-Newton steps have a natural unit length
+
+    def __init__(self, eps, update="eigh", memory=10):
+        """
+        Limited memory BFGS with the (s, y) pairs parallel transported along every step.
+
+        The first step (and the first after a reset) is eps * G. Later steps use the two-loop
+        recursion with the initial inverse Hessian s.y / y.y and a unit step length.
+
+        Args:
+            eps (float): step size of the first iteration
+            update (str): unitary step used by `transport`, see `unitary_update`
+            memory (int): number of (s, y) pairs kept. Defaults to 10.
+        """
+        self.memory = memory
+        super().__init__(eps, update=update)
+
+    def reset(self):
+        self._pairs = []  # (s, y, 1 / s.y)
+        self._G_prev = None
+        self._s = None
+
+    def direction(self, G, out=None):
+        if self._G_prev is not None:
+            # y is the change of the gradient, -G
+            s, y = self._s, self._G_prev - G
+            sy = inner(s, y)
+            # curvature condition, otherwise the pair is skipped
+            if sy > np.finfo(float).eps * np.sqrt(inner(s, s) * inner(y, y)):
+                self._pairs.append((s, y, 1 / sy))
+                if len(self._pairs) > self.memory:
+                    self._pairs.pop(0)
+
+        self._G = G
+        if len(self._pairs) == 0:
+            return self.eps * G
+
+        # two-loop recursion, H applied to the descent direction G
+        q = np.copy(G)
+        alphas = []
+        for s, y, rho in reversed(self._pairs):
+            a = rho * inner(s, q)
+            q -= a * y
+            alphas.append(a)
+        s, y, _ = self._pairs[-1]
+        D = (inner(s, y) / inner(y, y)) * q
+        for (s, y, rho), a in zip(self._pairs, reversed(alphas)):
+            b = rho * inner(y, D)
+            D += (a - b) * s
+        return D
+
+    def step_taken(self, D):
+        E = unitary_update(D / 2, method=self.update)
+        self._pairs = [(transport(s, E), transport(y, E), rho) for s, y, rho in self._pairs]
+        self._G_prev = transport(self._G, E)
+        self._s = D  # invariant under its own transport
+
+
+_optimizers: dict = {"sd": SteepestDescent, "cg": ConjugateGradient, "lbfgs": LBFGS}
+
+
+def get_optimizer(name: str, eps, update="eigh", **kwargs):
+    """
+    Returns the gauge optimizer "sd" (steepest descent), "cg" (Polak-Ribiere conjugate gradient)
+    or "lbfgs" (L-BFGS). Extra keyword arguments are passed to the optimizer.
+    """
+    assert name in _optimizers, f"optimizer must be one of {list(_optimizers)}"
+    return _optimizers[name](eps, update=update, **kwargs)
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# the tests import the package as the tutorials do, `WanPy.<module>` from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from WanPy.pythTB_wan import Wannier  # noqa: E402
+import WanPy.models as models  # noqa: E402
+
+
+@pytest.fixture
+def chessboard():
+    """2 x 2 supercell of the chessboard model, 8 orbitals and 4 occupied bands."""
+    return models.chessboard(0.4, 0.5, 1).make_supercell([[2, 0], [0, 2]])
+
+
+@pytest.fixture
+def wannier(chessboard):
+    """Projected Wannier functions of the occupied bands of `chessboard` on an 8 x 8 mesh."""
+    W = Wannier(chessboard, [8, 8])
+    W.single_shot([0, 2, 4, 6])
+    return W
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from WanPy.pythTB_wan import Wannier
+from WanPy.mixing import get_mixer
+
+
+def disentangle(model, iter_num=2000, **kwargs):
+    """Omega_I and states of the optimal 3 dimensional subspace of the occupied bands."""
+    W = Wannier(model, [8, 8])
+    W.single_shot([0, 2, 4])
+    u = W.find_optimal_subspace(iter_num=iter_num, tol=1e-12, **kwargs)
+    W.set_tilde_states(u, cell_periodic=True)
+    return W.get_Omega_I().real, W
+
+
+def test_anderson_fixed_point():
+    # contraction x -> B x + c, the fixed point solves (1 - B) x = c
+    rng = np.random.default_rng(0)
+    B = rng.normal(size=(6, 6))
+    B *= 0.9 / np.max(abs(np.linalg.eigvals(B)))
+    c = rng.normal(size=6)
+    x_star = np.linalg.solve(np.eye(6) - B, c)
+
+    iters = {}
+    for name in ["linear", "anderson"]:
+        mixer = get_mixer(name, alpha=0.5)
+        x = np.zeros(6)
+        for i in range(2000):
+            if np.linalg.norm(B @ x + c - x) < 1e-10:
+                break
+            x = mixer.mix(x, B @ x + c)
+        iters[name] = i
+        assert np.allclose(x, x_star, atol=1e-8)
+    assert iters["anderson"] < iters["linear"]
+
+
+def test_mixing_reaches_same_omega_I(chessboard):
+    om_linear, _ = disentangle(chessboard, mixing="linear")
+    om_anderson, _ = disentangle(chessboard, mixing="anderson")
+    assert om_anderson == pytest.approx(om_linear, abs=1e-7)
+
+
+def test_energy_window_matches_bands(chessboard):
+    E = Wannier(chessboard, [8, 8]).energy_eigstates.get_energies()
+    om_bands, _ = disentangle(chessboard, outer_window={"bands": [0, 1, 2, 3]})
+    # energy window holding exactly the occupied bands at every k-point
+    om_energy, _ = disentangle(chessboard, outer_window={"energy": [E.min() - 1, E[..., 3].max() + 1e-6]})
+    assert om_energy == pytest.approx(om_bands, abs=1e-8)
+
+
+def test_inner_window_is_frozen(chessboard):
+    E = Wannier(chessboard, [8, 8]).energy_eigstates.get_energies()
+    inner, outer = [-3, -1.9], [-3, 1.2]
+    inner_mask = (E >= inner[0]) & (E <= inner[1])
+    outer_mask = (E >= outer[0]) & (E <= outer[1])
+    # both windows hold a varying number of states, so they are padded
+    assert len(np.unique(inner_mask.sum(-1))) > 1 and len(np.unique(outer_mask.sum(-1))) > 1
+
+    _, W = disentangle(chessboard, inner_window={"energy": inner}, outer_window={"energy": outer})
+    u = W.tilde_states._u_wfs
+    assert np.allclose(u.conj() @ np.swapaxes(u, -1, -2), np.eye(u.shape[-2]), atol=1e-10)
+
+    # the frozen states lie in the subspace at every k-point
+    U = W.energy_eigstates._u_wfs
+    weight = np.sum(abs(U.conj() @ np.swapaxes(u, -1, -2)) ** 2, axis=-1)
+    assert np.allclose(weight[inner_mask], 1, atol=1e-10)
+
+
+def test_no_iterations_keep_initial_subspace(chessboard):
+    inner, outer = {"energy": [-3, -1.9]}, {"energy": [-3, 1.2]}
+    om_0, W = disentangle(chessboard, iter_num=0, inner_window=inner, outer_window=outer)
+    u = W.tilde_states._u_wfs
+    assert u.shape[-2] == 3
+    assert np.allclose(u.conj() @ np.swapaxes(u, -1, -2), np.eye(3), atol=1e-10)
+    om_min, _ = disentangle(chessboard, inner_window=inner, outer_window=outer)
+    assert om_min <= om_0
+
+    # without an inner window the band path starts from the tilde states
+    W = Wannier(chessboard, [8, 8])
+    W.single_shot([0, 2, 4])
+    assert np.array_equal(W.find_optimal_subspace(iter_num=0), W.tilde_states._u_wfs)
+
+
+def test_subspace_eig_solver(chessboard):
+    outer = {"bands": list(range(8))}
+    om_eigh, _ = disentangle(chessboard, outer_window=outer)
+    om_subspace, _ = disentangle(chessboard, outer_window=outer, eig_solver="subspace")
+    assert om_subspace == pytest.approx(om_eigh, abs=1e-7)
+
+    # 3 kept states out of the 4 occupied bands, too many for the subspace iteration
+    with pytest.warns(UserWarning, match="using 'eigh' instead"):
+        disentangle(chessboard, iter_num=5, eig_solver="subspace")
+    with pytest.raises(ValueError):
+        disentangle(chessboard, iter_num=5, eig_solver="lobpcg")
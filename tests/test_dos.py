@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from WanPy.dos import DOS_accumulator
+
+energies = np.linspace(-5, 5, 401)
+dE = energies[1] - energies[0]
+
+
+@pytest.fixture
+def interp_model(wannier):
+    return wannier.get_interp_model()
+
+
+@pytest.mark.parametrize("method", ["tetrahedron", "gaussian"])
+def test_dos_normalization_and_projections(interp_model, method):
+    dos, pdos = interp_model.get_dos([30, 24], energies, method=method, sigma=0.1, proj=True)
+    n_wfs = interp_model.n_wfs
+    assert np.sum(dos) * dE == pytest.approx(n_wfs, abs=1e-6)
+    # projections onto the Wannier functions add up to the total
+    assert np.allclose(np.sum(pdos, axis=0), dos, atol=1e-10)
+    assert np.allclose(np.sum(pdos, axis=1) * dE, 1, atol=1e-6)
+
+
+@pytest.mark.parametrize("method", ["tetrahedron", "gaussian"])
+def test_dos_independent_of_slabs(interp_model, method):
+    nks = [30, 24]
+    ref = interp_model.get_dos(nks, energies, method=method, n_rows=nks[0])
+    for n_rows in [1, 7]:
+        assert np.allclose(interp_model.get_dos(nks, energies, method=method, n_rows=n_rows), ref, atol=1e-12)
+
+    # same eigenvalues added at once
+    acc = DOS_accumulator(energies, method=method)
+    acc.add(interp_model.solve_mesh(nks))
+    assert np.allclose(acc.get_dos(), ref, atol=1e-12)
+
+
+def test_bloch_dos(wannier):
+    dos, pdos = wannier.energy_eigstates.get_dos(energies, proj=True)
+    n_orb = wannier.Lattice._n_orb
+    assert np.sum(dos) * dE == pytest.approx(n_orb, abs=1e-6)
+    assert np.allclose(np.sum(pdos, axis=0), dos, atol=1e-10)
+
+
+def test_tetrahedron_cubic_lattice():
+    # nearest neighbor cubic lattice, the tetrahedron DOS converges quickly with the mesh
+    E = np.linspace(-7, 7, 141)
+
+    def dos(nk):
+        k = np.arange(nk) / nk
+        kx, ky, kz = np.meshgrid(k, k, k, indexing="ij")
+        bands = -2 * (np.cos(2 * np.pi * kx) + np.cos(2 * np.pi * ky) + np.cos(2 * np.pi * kz))
+        acc = DOS_accumulator(E)
+        for lo in range(0, nk, 5):
+            acc.add(bands[lo: lo + 5, ..., np.newaxis])
+        return acc.get_dos()
+
+    coarse, fine = dos(16), dos(40)
+    assert np.sum(coarse) * (E[1] - E[0]) == pytest.approx(1, abs=1e-10)
+    assert np.max(abs(coarse - fine)) < 0.05 * np.max(fine)
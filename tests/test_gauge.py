@@ -0,0 +1,34 @@
+import numpy as np
+
+from WanPy.pythTB_wan import Bloch
+from WanPy.unitary import exp_antiherm
+
+
+def random_gauge(nks, n, seed=0):
+    rng = np.random.default_rng(seed)
+    A = rng.normal(size=(*nks, n, n)) + 1j * rng.normal(size=(*nks, n, n))
+    return exp_antiherm((A - np.swapaxes(A, -1, -2).conj()) / 2)
+
+
+def test_rotate_gauge_matches_set_wfs(wannier):
+    states = wannier.tilde_states
+    U = random_gauge(wannier._nks, states._n_states)
+    psi_rot = np.swapaxes(U, -1, -2) @ states._psi_wfs
+
+    ref = Bloch(states.model, *wannier._nks)
+    ref.set_wfs(psi_rot, cell_periodic=False)
+
+    states.rotate_gauge(U)
+    assert np.allclose(states._psi_wfs, ref._psi_wfs, atol=1e-12)
+    assert np.allclose(states._u_wfs, ref._u_wfs, atol=1e-12)
+    assert np.allclose(states._M, ref._M, atol=1e-12)
+
+
+def test_min_unitary_returns_rotated_overlaps(wannier):
+    M0 = wannier.tilde_states._M.copy()
+    _, U, M = wannier.find_min_unitary(eps=1e-3, iter_num=50, return_M=True)
+    assert np.allclose(M, wannier._rotate_overlaps(M0, U), atol=1e-12)
+
+    omega_til = wannier.omega_til
+    wannier.set_tilde_gauge(U, M=M)
+    assert wannier.omega_til < omega_til
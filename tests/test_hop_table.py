@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+from pythtb import tb_model
+
+import WanPy.models as models
+from WanPy.pythTB_wan import Hop_table
+from WanPy.WanPy import get_hop_table, gen_ham
+
+
+@pytest.mark.parametrize("model", [
+    models.chessboard(0.4, 0.5, 1).make_supercell([[2, 0], [0, 2]]),
+    models.Haldane(1, 1, 0.2),
+    ])
+def test_gen_ham_matches_pythtb(model):
+    k_pts = np.random.default_rng(0).random((3, 4, 2))
+    H_k = Hop_table(model).gen_ham(k_pts)
+    assert H_k.shape == (3, 4, model.get_num_orbitals(), model.get_num_orbitals())
+    ref = np.array([model._gen_ham(k) for k in k_pts.reshape(-1, 2)]).reshape(H_k.shape)
+    assert np.allclose(H_k, ref, atol=1e-12)
+
+    # functional API wraps the same table
+    assert np.allclose(gen_ham(get_hop_table(model), k_pts), H_k, atol=1e-14)
+
+
+def test_model_without_hoppings():
+    model = tb_model(2, 2, np.eye(2), [[0, 0], [0.5, 0.5]])
+    model.set_onsite([1.0, -2.0])
+    H_k = Hop_table(model).gen_ham(np.random.default_rng(0).random((5, 2)))
+    assert np.allclose(H_k, np.diag([1.0, -2.0]))
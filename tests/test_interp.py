@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from WanPy.pythTB_wan import K_mesh
+
+
+def test_H_R_matches_direct_sum(wannier):
+    H_R, R_vecs, deg = wannier.get_H_R(ws=False)
+    assert np.all(deg == 1)
+
+    u = wannier.tilde_states._u_wfs
+    H_rot_k = u.conj() @ wannier.tilde_states.H_k @ np.swapaxes(u, -1, -2)
+    Nk = np.prod(wannier._nks)
+    k_mesh = wannier.K_mesh.full_mesh.reshape(Nk, -1)
+    phase = np.exp(-1j * 2 * np.pi * k_mesh @ R_vecs.T)  # [k, R]
+    ref = np.einsum("kR, kmn -> Rmn", phase, H_rot_k.reshape(Nk, *H_rot_k.shape[-2:])) / Nk
+    assert np.allclose(H_R, ref, atol=1e-12)
+
+
+def test_interp_energies_on_mesh(wannier):
+    # the Wannier functions span the occupied bands, so the interpolation is exact on the mesh
+    E_occ = wannier.energy_eigstates.get_energies()[..., :4]
+    assert np.allclose(wannier.interp_energies(wannier.K_mesh.full_mesh), E_occ, atol=1e-10)
+
+
+@pytest.mark.parametrize("ws", [True, False])
+def test_interp_model_reproduces_mesh_energies(wannier, ws):
+    model = wannier.get_interp_model(ws=ws)
+    E_occ = wannier.energy_eigstates.get_energies()[..., :4]
+    assert np.allclose(model.solve(wannier.K_mesh.full_mesh), E_occ, atol=1e-10)
+    assert np.allclose(model.solve_mesh(wannier._nks), E_occ, atol=1e-10)
+
+    # batches of any shape
+    k_pts = np.random.default_rng(0).random((4, 5, 2))
+    H_k = model.get_ham(k_pts)
+    assert H_k.shape == (4, 5, 4, 4)
+    assert np.allclose(model.solve(k_pts), np.linalg.eigvalsh(H_k), atol=1e-12)
+
+
+@pytest.mark.parametrize("nks", [[8, 8], [9, 8], [5, 7]])
+def test_ws_degeneracies(chessboard, nks):
+    R_vecs, deg = K_mesh(chessboard, *nks).get_WS_R_vecs()
+    assert np.isclose(np.sum(1 / deg), np.prod(nks))
+    # every lattice vector of the mesh supercell appears, R mod nk covers the FFT grid
+    assert len({tuple(R) for R in R_vecs % np.array(nks)}) == np.prod(nks)
+
+
+def test_ws_interp_is_hermitian(wannier):
+    # the Wigner-Seitz vectors come in +-R pairs, unlike the FFT grid of an even mesh
+    model = wannier.get_interp_model()
+    H_k = model.get_ham(np.random.default_rng(0).random((20, 2)))
+    assert np.allclose(H_k, np.swapaxes(H_k, -1, -2).conj(), atol=1e-12)
+
+
+def test_dense_mesh_matches_direct_sum(wannier):
+    # slabs of the zero padded FFT agree with the direct sum over R
+    model = wannier.get_interp_model()
+    nks = [13, 10]
+    k_mesh = K_mesh(wannier._model, *nks).full_mesh
+    for n_rows in [4, None]:
+        assert np.allclose(model.solve_mesh(nks, n_rows=n_rows), model.solve(k_mesh), atol=1e-10)
+
+    H_k = model.get_ham(k_mesh)
+    for rows, H_slab in model.iter_mesh(nks, n_rows=4, ret_ham=True):
+        assert np.allclose(H_slab, H_k[rows], atol=1e-10)
@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+
+from WanPy.pythTB_wan import K_mesh
+
+
+def dense_boundary_phase(k_mesh):
+    """Reference table exp(-i G . r) of every k-point and neighbor [*nks, b, orb], looping over the mesh."""
+    orbs = k_mesh.Lattice._orbs
+    idx_shell = k_mesh.nnbr_idx_shell[0]
+    bc_phase = np.ones((*k_mesh.nks, len(idx_shell), orbs.shape[0]), dtype=complex)
+    for k_idx in k_mesh.idx_arr:
+        for b, idx_vec in enumerate(idx_shell):
+            k_nbr_idx = np.array(k_idx) + idx_vec
+            G = (k_nbr_idx - np.mod(k_nbr_idx, k_mesh.nks)) / np.array(k_mesh.nks)
+            bc_phase[k_idx][b] = np.exp(-1j * 2 * np.pi * orbs @ G)
+    return bc_phase
+
+
+@pytest.fixture(params=[[6, 6], [5, 4]])
+def k_mesh(chessboard, request):
+    return K_mesh(chessboard, *request.param)
+
+
+def test_slab_boundary_phases(k_mesh):
+    ref = dense_boundary_phase(k_mesh)
+    for b, slabs in enumerate(k_mesh.bc_phase):
+        phase = np.ones((*k_mesh.nks, ref.shape[-1]), dtype=complex)
+        for axis, slab, phase_ax in slabs:
+            index = [slice(None)] * k_mesh.dim
+            index[axis] = slab
+            phase[tuple(index)] *= phase_ax
+        assert np.allclose(phase, ref[..., b, :], atol=1e-14)
+
+
+def test_nbr_states_match_rolled_mesh(k_mesh):
+    rng = np.random.default_rng(0)
+    n_orb = k_mesh.Lattice._n_orb
+    states = rng.normal(size=(*k_mesh.nks, 3, n_orb)) + 1j * rng.normal(size=(*k_mesh.nks, 3, n_orb))
+    U = rng.normal(size=(*k_mesh.nks, 3, 3)) + 1j * rng.normal(size=(*k_mesh.nks, 3, 3))
+    bc_phase = dense_boundary_phase(k_mesh)
+    axes = tuple(range(k_mesh.dim))
+
+    M = k_mesh.get_overlap_mat(states)
+    U_nbr = k_mesh.get_nbr_gauge(U)
+    for b, idx_vec in enumerate(k_mesh.nnbr_idx_shell[0]):
+        ref = np.roll(states, shift=tuple(-idx_vec), axis=axes) * bc_phase[..., b, np.newaxis, :]
+        assert np.allclose(k_mesh.get_nbr_states(states, b), ref, atol=1e-14)
+        assert np.allclose(M[..., b, :, :], states.conj() @ np.swapaxes(ref, -1, -2), atol=1e-12)
+
+        # the gauge is periodic, no boundary phase
+        U_ref = np.roll(U, shift=tuple(-idx_vec), axis=axes)
+        assert np.array_equal(U_nbr[..., b, :, :], U_ref)
+        assert np.array_equal(k_mesh.get_nbr_gauge(U, idx=b), U_ref)
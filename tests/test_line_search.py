@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+
+
+@pytest.mark.parametrize("method", ["armijo", "quadratic"])
+def test_line_search_decreases_omega_tilde(wannier, method):
+    M = wannier.tilde_states._M
+    w_b, k_shell, _ = wannier.K_mesh.get_weights()
+    omega_0, _, G = wannier._get_Omega_til_grad(M, w_b[0], k_shell[0])
+    slope = -np.real(np.vdot(G, G)) / np.prod(wannier._nks)
+
+    # the first trial overshoots, the accepted step satisfies the sufficient decrease condition
+    t, dU, M_t, omega_t = wannier._gauge_line_search(M, G, omega_0, slope, 1.0, method=method)
+    assert 0 < t < 1
+    assert omega_t <= omega_0 + 1e-4 * t * slope
+    assert np.allclose(M_t, wannier._rotate_overlaps(M, dU), atol=1e-12)
+    assert omega_t == pytest.approx(wannier._get_Omega_til(M_t, w_b[0], k_shell[0]), abs=1e-12)
+
+
+def test_step_history(wannier):
+    wannier.find_min_unitary(eps=1e-3, iter_num=50, line_search="armijo")
+    assert len(wannier.step_history) > 0
+    assert all(t > 0 for t in wannier.step_history)
+
+    wannier.find_min_unitary(eps=1e-3, iter_num=50)
+    assert wannier.step_history == []
+
+    with pytest.raises(AssertionError):
+        wannier.find_min_unitary(eps=1e-3, iter_num=5, line_search="wolfe")
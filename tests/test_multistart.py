@@ -0,0 +1,21 @@
+import numpy as np
+import pytest
+
+
+def test_multistart(wannier):
+    kwargs = dict(eps=1e-3, tol=1e-12, grad_min=1e-7, optimizer="lbfgs", line_search="armijo")
+    _, U, M = wannier.find_min_unitary_multistart(
+        n_starts=3, n_keep=2, iter_num_explore=20, iter_num=500, n_procs=2, seed=0, return_M=True, **kwargs)
+
+    history = wannier.multistart_history
+    assert len(history["explore"]) == 3 and len(history["refine"]) == 2
+    assert history["kept"] == list(np.argsort(history["explore"])[:2])
+
+    # the best candidate is returned with its overlaps
+    w_b, k_shell, _ = wannier.K_mesh.get_weights()
+    assert np.allclose(M, wannier._rotate_overlaps(wannier.tilde_states._M, U), atol=1e-12)
+    omega_til = wannier._get_Omega_til(M, w_b[0], k_shell[0]).real
+    assert omega_til == pytest.approx(min(history["refine"]), abs=1e-12)
+
+    _, _, M_single = wannier.find_min_unitary(iter_num=520, return_M=True, **kwargs)
+    assert omega_til <= wannier._get_Omega_til(M_single, w_b[0], k_shell[0]).real + 1e-8
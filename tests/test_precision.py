@@ -0,0 +1,49 @@
+import copy
+
+import numpy as np
+import pytest
+
+from WanPy.pythTB_wan import Wannier
+
+
+@pytest.mark.parametrize("optimizer, line_search", [("sd", "armijo"), ("cg", None), ("lbfgs", "armijo")])
+def test_single_precision_minimum(wannier, optimizer, line_search):
+    W_single = copy.deepcopy(wannier)
+    W_single.set_precision("single")
+    assert W_single.tilde_states._M.dtype == np.complex64
+
+    kwargs = dict(eps=1e-3, iter_num=2000, tol=1e-14, grad_min=1e-9, optimizer=optimizer, line_search=line_search)
+    _, U_double = wannier.find_min_unitary(**kwargs)
+    _, U_single = W_single.find_min_unitary(**kwargs)
+    assert U_single.dtype == np.complex64
+
+    # single precision gauge is unitary to single precision and reaches the double precision minimum
+    U = U_single.astype(complex)
+    assert np.allclose(np.swapaxes(U, -1, -2).conj() @ U, np.eye(U.shape[-1]), atol=1e-6)
+
+    w_b, k_shell, _ = wannier.K_mesh.get_weights()
+    M0 = wannier.tilde_states._M
+    omega_double = wannier._get_Omega_til(wannier._rotate_overlaps(M0, U_double), w_b[0], k_shell[0])
+    omega_single = wannier._get_Omega_til(wannier._rotate_overlaps(M0, U), w_b[0], k_shell[0])
+    assert omega_single == pytest.approx(omega_double, abs=1e-6)
+
+
+def test_max_loc_refines_in_double(chessboard):
+    W = Wannier(chessboard, [8, 8], precision="single")
+    W.single_shot([0, 2, 4])
+    energies = W.energy_eigstates.energies.copy()
+    W.max_loc(
+        iter_num_omega_i=100, iter_num_omega_til=100, tol_omega_i=1e-8, optimizer="lbfgs", line_search="armijo",
+        iter_num_refine=20
+        )
+
+    # the spreads and Wannier functions come from the refined double precision states
+    assert W.spread_precision == "double" and W.WFs.dtype == np.complex128
+    omega_til = W.omega_til
+
+    # the working precision is single again, the energy eigenstates are recast rather than solved again
+    assert W.tilde_states._M.dtype == np.complex64
+    assert np.array_equal(W.energy_eigstates.energies, energies)
+    W.set_precision("single")
+    assert W.spread_precision == "single"
+    assert W.omega_til == pytest.approx(omega_til, abs=1e-5)
@@ -0,0 +1,47 @@
+import numpy as np
+import pytest
+
+from WanPy.unitary import unitary_update
+
+
+def random_antiherm(shape, scale=1.0, seed=0):
+    rng = np.random.default_rng(seed)
+    A = rng.normal(size=shape) + 1j * rng.normal(size=shape)
+    return scale * (A - np.swapaxes(A, -1, -2).conj()) / 2
+
+
+@pytest.mark.parametrize("method", ["eigh", "cayley"])
+def test_update_is_unitary(method):
+    A = random_antiherm((6, 5, 4, 4), scale=2.0)
+    U = unitary_update(A, method=method)
+    eye = np.eye(4)
+    assert np.allclose(np.swapaxes(U, -1, -2).conj() @ U, eye, atol=1e-12)
+    assert np.allclose(U @ np.swapaxes(U, -1, -2).conj(), eye, atol=1e-12)
+
+
+def test_exponentials_agree():
+    from scipy.linalg import expm
+
+    A = random_antiherm((3, 4, 4), scale=0.5)
+    ref = np.array([expm(a) for a in A])
+    assert np.allclose(unitary_update(A, method="eigh"), ref, atol=1e-12)
+    assert np.allclose(unitary_update(A, method="eig"), ref, atol=1e-10)
+    # Cayley agrees up to O(A^3)
+    small = 1e-3 * A
+    assert np.allclose(unitary_update(small, method="cayley"), [expm(a) for a in small], atol=1e-8)
+
+
+def test_optimizers_reach_same_omega_tilde(wannier):
+    M = wannier.tilde_states._M
+    w_b, k_shell, _ = wannier.K_mesh.get_weights()
+    omega_til = {}
+    for optimizer, iter_num in [("sd", 6000), ("cg", 1000), ("lbfgs", 1000)]:
+        U, M_rot = wannier._min_unitary(
+            M, eps=1e-3, iter_num=iter_num, tol=1e-12, grad_min=1e-7, optimizer=optimizer)
+        omega_til[optimizer] = wannier._get_Omega_til(M_rot, w_b[0], k_shell[0]).real
+        # the gauge stays unitary
+        assert np.allclose(np.swapaxes(U, -1, -2).conj() @ U, np.eye(U.shape[-1]), atol=1e-10)
+
+    assert omega_til["lbfgs"] < wannier.omega_til
+    assert omega_til["cg"] == pytest.approx(omega_til["lbfgs"], abs=1e-7)
+    assert omega_til["sd"] == pytest.approx(omega_til["lbfgs"], abs=1e-6)